@@ -1,5 +1,6 @@
 from pyspark.sql import functions as F
-from pyspark.sql.types import ByteType, DecimalType, DoubleType, FloatType, IntegerType, LongType, ShortType
+from pyspark.sql.types import ByteType, DecimalType, DoubleType, FloatType, IntegerType, LongType, ShortType, StructField, StructType
+from sklearn.ensemble import IsolationForest
 
 def is_numeric(data_type):
     return isinstance(data_type, (ByteType, DecimalType, DoubleType, FloatType, IntegerType, LongType, ShortType))
@@ -19,52 +20,111 @@ def _calculate_outliers(df, col):
 
     return {"count": outlier_count, "lower_range": lower_range, "upper_range": upper_range, "values": outlier_values}
 
-def _compare_dataframes(df1, df2):
-    column_diffs = []
+def _fingerprint(df):
+    # Order-independent fingerprints of the whole table and of each column, computed in a single aggregation:
+    # the sums of the 64-bit hashes of the rows and of the column values, as decimals so they can't overflow
+    row_hash = F.xxhash64(*[F.col(col) for col in df.columns])
+    aggregates = [F.count(F.lit(1)).alias('rows'), F.sum(row_hash.cast(DecimalType(38, 0))).alias('table')]
+    aggregates += [F.sum(F.xxhash64(F.col(col)).cast(DecimalType(38, 0))).alias(f'column_{i}') for i, col in enumerate(df.columns)]
+    result = df.agg(*aggregates).first()
 
-    for col in df1.columns:
-        # Number and percent of differences per column
-        col_diff = df1.filter(df1[col] != df2[col]).count()
-        per_diff = col_diff / df1.count() * 100
+    return result['rows'], result['table'], {col: result[f'column_{i}'] for i, col in enumerate(df.columns)}
 
-        # number of non-null rows and distinct values in both dataframes
-        non_null_rows_df1 = df1.filter(df1[col].isNotNull()).count()
-        non_null_rows_df2 = df2.filter(df2[col].isNotNull()).count()
+def _profile_column(df, col):
+    # number of non-null rows and distinct values
+    non_null_rows = df.filter(df[col].isNotNull()).count()
+    distinct_values = df.agg(F.countDistinct(df[col])).first()[0]
 
-        distinct_values_df1 = df1.agg(F.countDistinct(df1[col])).first()[0]
-        distinct_values_df2 = df2.agg(F.countDistinct(df2[col])).first()[0]
+    # top 5 values
+    top_values = df.groupBy(col).count().orderBy(F.col("count").desc()).limit(5).collect()
 
-        # top 5 values for each dataframes
-        top_values_df1 = df1.groupBy(col).count().orderBy(F.col("count").desc()).limit(5).collect()
-        top_values_df2 = df2.groupBy(col).count().orderBy(F.col("count").desc()).limit(5).collect()
+    # If the column type is numeric
+    if is_numeric(df.schema[col].dataType):
+        stats = df.select(
+            F.mean(col).alias('mean'),
+            F.stddev(col).alias('stddev'),
+            F.sum(col).alias('sum')
+        ).first()
 
-        # If the column type is numeric
-        if is_numeric(df1.schema[col].dataType):
-            stats_df1 = df1.select(
-                F.mean(col).alias('mean'),
-                F.stddev(col).alias('stddev'),
-                F.sum(col).alias('sum')
-            ).first()
+        # Calculate approximate median. Set the relative error parameter to 0.01.
+        median = df.approxQuantile(col, [0.5], 0.01)[0]
 
-            stats_df2 = df2.select(
-                F.mean(col).alias('mean'),
-                F.stddev(col).alias('stddev'),
-                F.sum(col).alias('sum')
-            ).first()
+        # Calculate outliers
+        outliers = _calculate_outliers(df, col)
 
-            # Calculate approximate median. Set the relative error parameter to 0.01.
-            median_df1 = df1.approxQuantile(col, [0.5], 0.01)[0]
-            median_df2 = df2.approxQuantile(col, [0.5], 0.01)[0]
+    else:
+        stats = median = outliers = None
 
-            # Calculate outliers
-            outliers_df1 = _calculate_outliers(df1, col)
-            outliers_df2 = _calculate_outliers(df2, col)
+    return non_null_rows, distinct_values, top_values, stats, median, outliers
+
+def _compare_dataframes(df1, df2):
+    column_diffs = []
 
-        else:
-            stats_df1 = stats_df2 = median_df1 = median_df2 = outliers_df1 = outliers_df2 = None
+    rows1, table1, columns1 = _fingerprint(df1)
+    rows2, table2, columns2 = _fingerprint(df2)
+    identical_tables = df1.columns == df2.columns and df1.schema == df2.schema and (rows1, table1) == (rows2, table2)
+
+    for col in df1.columns:
+        # Columns holding the same values skip the difference count and df2's profile: identical data has identical
+        # statistics, so df1's are reported for both
+        identical = identical_tables or (col in columns2 and df1.schema[col].dataType == df2.schema[col].dataType and
+                                         columns1[col] == columns2[col])
+
+        # Number and percent of differences per column
+        col_diff = 0 if identical else df1.filter(df1[col] != df2[col]).count()
+        per_diff = col_diff / rows1 * 100
+
+        profile_df1 = _profile_column(df1, col)
+        profile_df2 = profile_df1 if identical else _profile_column(df2, col)
+        non_null_rows_df1, distinct_values_df1, top_values_df1, stats_df1, median_df1, outliers_df1 = profile_df1
+        non_null_rows_df2, distinct_values_df2, top_values_df2, stats_df2, median_df2, outliers_df2 = profile_df2
 
         column_diffs.append([col, col_diff, per_diff, non_null_rows_df1, non_null_rows_df2,
                              distinct_values_df1, distinct_values_df2, top_values_df1, top_values_df2,
                              stats_df1, stats_df2, median_df1, median_df2, outliers_df1, outliers_df2])
 
     return column_diffs
+
+def detect_anomalies(df1, df2, column_list=None, contamination=0.005, sample_size=100000, output_path=None, seed=None):
+    # Select only numeric columns from df1 by default
+    if column_list is None:
+        columns = [field.name for field in df1.schema.fields if is_numeric(field.dataType)]
+    else:
+        columns = list(column_list)
+
+    # Ensure all provided columns exist in the dataframes and are numeric
+    for column in columns:
+        if column not in df1.columns or column not in df2.columns:
+            raise ValueError(f"Column '{column}' not found in one or both dataframes.")
+        if not is_numeric(df1.schema[column].dataType) or not is_numeric(df2.schema[column].dataType):
+            raise ValueError(f"Column '{column}' is not numeric in one or both dataframes.")
+
+    # Handle missing values. Like the pandas version, only the modelled columns of df2 are returned with the flag
+    df1 = df1.select(columns).dropna()
+    df2 = df2.select(columns).dropna()
+
+    # Fit the model on the driver, on a sample of df1 small enough to collect
+    rows = df1.count()
+    fraction = min(1.0, sample_size / rows) if rows else 1.0
+    sample = df1.sample(fraction=fraction, seed=seed).limit(sample_size).toPandas().astype('float64')
+    if sample.empty:
+        raise ValueError("No rows of df1 without missing values in the selected columns to fit the anomaly detector on.")
+    iso = IsolationForest(contamination=contamination, random_state=seed)
+    iso.fit(sample)
+
+    # Ship the fitted model to the executors once, and score df2 there in vectorized pandas batches
+    model = df2.sparkSession.sparkContext.broadcast(iso)
+
+    def score(batches):
+        for batch in batches:
+            batch['anomaly'] = model.value.predict(batch[columns].astype('float64')).astype('int32')
+            # Only the anomalous rows leave the executors
+            yield batch[batch['anomaly'] == -1]
+
+    schema = StructType(df2.schema.fields + [StructField('anomaly', IntegerType(), False)])
+    anomalies = df2.mapInPandas(score, schema)
+
+    if output_path is not None:
+        anomalies.write.mode('overwrite').parquet(output_path)
+
+    return anomalies
@@ -1,7 +1,29 @@
 import pandas as pd
+import glob
+import hashlib
+import io
 import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from statistics import NormalDist
+import numpy as np
 from sklearn.ensemble import IsolationForest
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
 # This module contains functions to compare two dataframes.
 # Key assumptions made about the input dataframes:
 # - Row counts are the same in both dataframes
@@ -9,6 +31,14 @@ from sklearn.ensemble import IsolationForest
 # - Columns have the same names and data types
 # Any deviation from these assumptions will be identified and reported in the program output,
 # therefore it is important to ensure these assumptions are fulfilled before using these comparison functions.
+#
+# Nulls: two null values (NaN, None, NA or NaT) compare as equal, a null and a value compare as different.
+#
+# Memory: input dataframes are never modified and are not copied when aligning them. The aligned dataframes share
+# the inputs' column data, columns missing from one input are added to a shallow copy, and detect_anomalies
+# only copies the columns it models. The largest allocation is the eager row_diffs frame, see RowDiffs to avoid it.
+
+logger = logging.getLogger(__name__)
 
 def _read_csv(filepath):
     """
@@ -21,30 +51,42 @@ def _read_csv(filepath):
     except FileNotFoundError:
         raise ValueError(f"No file found at path '{filepath}'")
 
-def _ensure_same_shape(df1, df2):
+def _align_columns(df, columns):
     """
-    This function ensures the two dataframes have the same shape & dtypes.
-    It aligns columns, checks that the number of rows and dtypes is the same for both dataframes.
+    This function returns a dataframe with the given columns, in the given order, without copying any data.
+    Columns missing from df are added as NaN columns to a shallow copy, so the caller's dataframe is not modified.
     """
-    new_cols_in_df1 = []
-    new_cols_in_df2 = []
+    missing_cols = [col for col in columns if col not in df.columns]
+    if missing_cols:
+        df = df.copy(deep=False)
+        for col in missing_cols:
+            df[col] = pd.NA
+
+    if list(df.columns) == list(columns):
+        return df
 
-    # Check if both dataframes have the same columns
-    if set(df1.columns) != set(df2.columns):
-        common_cols = set(df1.columns).intersection(set(df2.columns))
-        missing_cols_df1 = set(df2.columns) - common_cols
-        missing_cols_df2 = set(df1.columns) - common_cols
+    # Selecting columns with df[columns] copies them, a dataframe built from the columns themselves shares their data
+    return pd.DataFrame({col: df[col] for col in columns}, index=df.index, copy=False)
 
-        # Add missing columns filled with NaN
-        for col in missing_cols_df1:
-            df1[col] = pd.NA
-            new_cols_in_df1.append(col)
-        for col in missing_cols_df2:
-            df2[col] = pd.NA
-            new_cols_in_df2.append(col)
+def _align_frames(df1, df2):
+    """
+    This function aligns both dataframes on the columns of df2, followed by those only in df1, and returns them
+    with the columns missing from df1 and from df2. Unlike _ensure_same_shape, dtypes and row counts are not
+    checked, for partial reads where a few rows of a column may be parsed with another dtype than the whole file.
+    """
+    new_cols_in_df1 = [col for col in df2.columns if col not in df1.columns]
+    new_cols_in_df2 = [col for col in df1.columns if col not in df2.columns]
+    columns = list(df2.columns) + new_cols_in_df2
+    return _align_columns(df1, columns), _align_columns(df2, columns), new_cols_in_df1, new_cols_in_df2
 
-    # Ensure same column order in both dataframes
-    df1 = df1[df2.columns]
+def _ensure_same_shape(df1, df2):
+    """
+    This function ensures the two dataframes have the same shape & dtypes.
+    It aligns columns, checks that the number of rows and dtypes is the same for both dataframes.
+    The input dataframes are not modified and no column data is copied: the returned dataframes share the
+    inputs' columns, and only columns missing from one dataframe are allocated (one NaN reference per row).
+    """
+    df1, df2, new_cols_in_df1, new_cols_in_df2 = _align_frames(df1, df2)
 
     # Check if both dataframes have the same dtypes at the same column positions
     if not all(df1.dtypes == df2.dtypes):
@@ -69,82 +111,538 @@ def _calculate_outliers(df, col):
                   (df[col] > (Q3 + 1.5 * IQR))][col]
     return outliers
 
-def _calculate_changes_summary(df1, df2, col):
+def _float_differences(values1, values2):
+    """
+    This function returns the mask of the positions where two float arrays differ, two NaNs being equal.
+    """
+    return (values1 != values2) & ~(np.isnan(values1) & np.isnan(values2))
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _float_differences(values1, values2):
+        differences = np.empty(len(values1), dtype=np.bool_)
+        for i in range(len(values1)):
+            differences[i] = values1[i] != values2[i] and not (np.isnan(values1[i]) and np.isnan(values2[i]))
+        return differences
+
+def _shared_codes(series1, series2):
+    """
+    This function encodes two non-numeric columns (object or Arrow strings, categoricals, dates...) as integer
+    codes over one dictionary of values unified for both, so they can be compared and counted on the codes.
+    Categoricals with the same categories already share their codes. Nulls are coded -1.
+    Returns the codes of both columns and the dictionary, or None if the values can't be hashed.
+    """
+    if (isinstance(series1.dtype, pd.CategoricalDtype) and isinstance(series2.dtype, pd.CategoricalDtype) and
+            series1.cat.categories.equals(series2.cat.categories)):
+        return series1.cat.codes.to_numpy(), series2.cat.codes.to_numpy(), series1.cat.categories
+    try:
+        codes, uniques = pd.factorize(pd.concat([series1, series2], ignore_index=True))
+    except TypeError:
+        return None
+    return codes[:len(series1)], codes[len(series1):], uniques
+
+def _is_numeric_pair(series1, series2):
+    return series1.dtype.kind in 'fiub' and series2.dtype.kind in 'fiub'
+
+def _numeric_values(series):
+    """
+    This function returns the values of a numeric column as a NumPy array. Masked and Arrow dtypes (Int64,
+    boolean...) can't hold their nulls in NumPy, they are filled with zeros and must be masked by the caller.
+    """
+    if isinstance(series.dtype, np.dtype):
+        return series.to_numpy()
+    numpy_dtype = series.dtype.numpy_dtype
+    return series.to_numpy(dtype=numpy_dtype, na_value=numpy_dtype.type(0).item())
+
+def _difference_mask(series1, series2, codes=None):
+    """
+    This function computes the mask of the rows where two aligned columns differ, as a boolean array.
+    It is the single definition of a difference used by every comparison: two nulls are equal, a null and
+    a value differ. Float columns go through a vectorized kernel, compiled with Numba when it is installed,
+    and other columns are compared on the shared codes of _shared_codes, which can be passed if already computed.
     """
-    This function calculates the changes from df1 to df2 in the given column,
+    if _is_numeric_pair(series1, series2):
+        values1 = _numeric_values(series1)
+        values2 = _numeric_values(series2)
+        if values1.dtype.kind == 'f' or values2.dtype.kind == 'f':
+            differs = _float_differences(values1.astype(np.float64, copy=False), values2.astype(np.float64, copy=False))
+        else:
+            differs = values1 != values2
+        if isinstance(series1.dtype, np.dtype) and isinstance(series2.dtype, np.dtype):
+            return differs
+        # Nulls of masked and Arrow dtypes were filled above, those rows are settled by the null masks
+        nulls1 = series1.isna().to_numpy()
+        nulls2 = series2.isna().to_numpy()
+        return (differs & ~(nulls1 | nulls2)) | (nulls1 ^ nulls2)
+
+    if codes is None:
+        codes = _shared_codes(series1, series2)
+    if codes is not None:
+        # Nulls share the -1 code, so they compare as equal to each other and different from any value
+        return codes[0] != codes[1]
+
+    # Unhashable values, like lists, are compared one by one
+    nulls1 = series1.isna().to_numpy()
+    nulls2 = series2.isna().to_numpy()
+    try:
+        differs = series1 != series2
+    except TypeError:
+        # Categoricals with different categories can't be compared directly
+        differs = series1.astype(object) != series2.astype(object)
+    # Extension dtypes return NA where either side is null, those rows are settled by the null masks
+    differs = differs.to_numpy(dtype=bool, na_value=True)
+    return (differs & ~(nulls1 | nulls2)) | (nulls1 ^ nulls2)
+
+class ComparisonCancelled(Exception):
+    """
+    Raised by a comparison when its cancel event is set.
+    """
+
+class _Progress:
+    """
+    Reports the progress of one phase of a long-running comparison to a callback, and checks the cancel event
+    (a threading.Event) on every update. The callback receives a dict with the phase, rows and columns done and
+    total, elapsed seconds, throughput in rows per second and the estimated seconds left in the phase.
+    In phases processed column by column, rows_done counts the share of the rows of the columns done.
+    """
+    def __init__(self, callback, cancel, phase, rows_total, columns_total=0):
+        self.callback = callback
+        self.cancel = cancel
+        self.phase = phase
+        self.rows_total = rows_total
+        self.columns_total = columns_total
+        self.start = time.monotonic()
+        self.check()
+
+    def check(self):
+        if self.cancel is not None and self.cancel.is_set():
+            raise ComparisonCancelled(f"The comparison was cancelled during the '{self.phase}' phase.")
+
+    def update(self, rows_done=None, columns_done=None):
+        self.check()
+        if self.callback is None:
+            return
+        if rows_done is None:
+            rows_done = self.rows_total * columns_done // max(self.columns_total, 1)
+        elapsed = time.monotonic() - self.start
+        throughput = rows_done / elapsed if elapsed > 0 else None
+        if rows_done >= self.rows_total:
+            eta = 0.0
+        else:
+            eta = (self.rows_total - rows_done) / throughput if throughput else None
+        self.callback({'phase': self.phase, 'rows_done': rows_done, 'rows_total': self.rows_total,
+                       'columns_done': columns_done, 'columns_total': self.columns_total,
+                       'elapsed': elapsed, 'rows_per_second': throughput, 'eta': eta})
+
+def _count_changes(df1, df2, col, mask=None, codes=None):
+    """
+    This function counts each distinct change (from, to) from df1 to df2 in the given column,
     considering the change from value to NaN or from NaN to value as a change as well.
+    NaN values are replaced with a 'NaN' placeholder.
+    The difference mask and the shared codes of the column can be passed to avoid recomputing them.
+    With codes, changes are counted on pairs of codes and only the distinct changes are decoded.
     """
-    changes_df = pd.DataFrame()
-    mask = pd.isna(df1[col]) ^ pd.isna(df2[col])
-    changes_df['from'] = df1.loc[mask | (df1[col] != df2[col]), col]
-    changes_df['to'] = df2.loc[mask | (df1[col] != df2[col]), col]
+    if mask is None:
+        mask = _difference_mask(df1[col], df2[col], codes)
+    if codes is not None:
+        codes1, codes2, uniques = codes
+        # Codes are shifted by one so the -1 null code packs into the pair key too
+        pairs, counts = np.unique((codes1[mask].astype(np.int64) + 1) * (len(uniques) + 1) + codes2[mask] + 1, return_counts=True)
+        values = np.append(np.asarray(uniques, dtype=object), None)
+        changes_df = pd.DataFrame({'from': values[pairs // (len(uniques) + 1) - 1], 'to': values[pairs % (len(uniques) + 1) - 1],
+                                   'count': counts})
+        changes_df[['from', 'to']] = changes_df[['from', 'to']].fillna('NaN')
+        return changes_df.groupby(['from', 'to'])['count'].sum().rename(None)
+
+    changes_df = pd.DataFrame({'from': df1[col][mask], 'to': df2[col][mask]})
+
+    # Categoricals and floats can't hold the placeholder below, only the changed values are converted
+    if isinstance(df1[col].dtype, pd.CategoricalDtype) or changes_df.isna().any(axis=None):
+        changes_df = changes_df.astype(object)
 
     # Replace NaN values with a placeholder
     changes_df.fillna('NaN', inplace=True)
 
-    changes_summary = changes_df.groupby(['from', 'to']).size().reset_index().rename(columns={0:'count'}).sort_values(by='count', ascending=False)[:5]
+    return changes_df.groupby(['from', 'to']).size()
 
+def _format_changes_summary(changes_summary):
+    """
+    This function turns the top changes (a dataframe with 'from', 'to' and 'count' columns) into JSON.
+    """
     # Replace the placeholder back with nan in the 'from' and 'to' columns
     changes_summary.replace('NaN', pd.NA, inplace=True)
 
-    changes_summary_json = json.dumps(changes_summary.to_dict(orient='records'))
+    return json.dumps(changes_summary.to_dict(orient='records'))
+
+def _calculate_changes_summary(df1, df2, col, mask=None, codes=None):
+    """
+    This function calculates the top 5 changes from df1 to df2 in the given column.
+    """
+    changes_summary = _count_changes(df1, df2, col, mask, codes).reset_index().rename(columns={0:'count'}).sort_values(by='count', ascending=False)[:5]
 
-    return changes_summary_json
+    return _format_changes_summary(changes_summary)
 
-def _compare_dataframes(df1, df2):
+def _code_counts(codes, uniques):
     """
-    This function compares the two given dataframes column by column.
+    This function counts the values of a column from its codes over the dictionary uniques, like value_counts:
+    by decreasing count, values with the same count in order of first appearance.
     """
-    column_diffs = []
+    present = pd.unique(codes[codes >= 0])
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))[present]
+    return pd.Series(counts, index=pd.Index(np.asarray(uniques, dtype=object)[present])).sort_values(ascending=False)
 
-    for col in df1.columns:
-        col_diff = (df1[col] != df2[col]).sum()
-        per_diff = col_diff / len(df1) * 100
-        changes_summary_json = _calculate_changes_summary(df1, df2, col)
+def _value_counts(series, codes=None, uniques=None):
+    """
+    This function counts the non-null values of a column, on its codes over the dictionary uniques if given.
+    """
+    if codes is not None:
+        return _code_counts(codes, uniques)
+    value_counts = series.value_counts()
+    # Categoricals also count their unused categories, which are not values of the column
+    return value_counts[value_counts > 0]
 
-        non_null_rows_df1 = df1[col].count()
-        non_null_rows_df2 = df2[col].count()
+def _profile_column(df, col, value_counts=None, drift_bins=False):
+    """
+    This function calculates the statistics of a column that only depend on one dataframe:
+    non-null rows, distinct values, median, mean, standard deviation, sum, top 5 values and outliers.
+    The value counts of the column from _value_counts can be passed to avoid counting them again, and are
+    kept in the profile along with, with drift_bins, the _drift_bins of a numeric column, so comparisons
+    against a reused profile don't compute them again.
+    """
+    if value_counts is None:
+        value_counts = _value_counts(df[col])
+    non_null_rows = value_counts.sum()
+    distinct_values = len(value_counts)
+    top_values = value_counts.nlargest(5).to_dict()
+
+    if pd.api.types.is_numeric_dtype(df[col]):
+        # Booleans have no quantiles, their statistics are computed on 0 and 1
+        values = df[col].astype('Float64') if pd.api.types.is_bool_dtype(df[col]) else df[col]
+        median = values.median()
+        mean = values.mean()
+        std = values.std()
+        col_sum = values.sum()
+        outliers = _calculate_outliers(values.to_frame(), col).to_json()
+    else:
+        median = mean = std = col_sum = outliers = None
 
-        distinct_values_df1 = df1[col].nunique()
-        distinct_values_df2 = df2[col].nunique()
+    bins = None
+    if drift_bins and pd.api.types.is_numeric_dtype(df[col]):
+        bins = _drift_bins(df[col].dropna().to_numpy(dtype=np.float64))
 
-        top_values_df1 = df1[col].value_counts().nlargest(5).to_dict()
-        top_values_df2 = df2[col].value_counts().nlargest(5).to_dict()
+    return {'non_null_rows': non_null_rows, 'distinct_values': distinct_values, 'median': median, 'mean': mean,
+            'std': std, 'sum': col_sum, 'top_values': top_values, 'outliers': outliers,
+            'value_counts': value_counts, 'drift_bins': bins}
 
-        if pd.api.types.is_numeric_dtype(df1[col]):
-            median_df1 = df1[col].median()
-            mean_df1 = df1[col].mean()
-            std_df1 = df1[col].std()
-            sum_df1 = df1[col].sum()
+def _profile_dataframe(df):
+    """
+    This function profiles every column of a dataframe, so the profile can be reused across comparisons.
+    """
+    return {col: _profile_column(df, col, drift_bins=True) for col in df.columns}
 
-            median_df2 = df2[col].median()
-            mean_df2 = df2[col].mean()
-            std_df2 = df2[col].std()
-            sum_df2 = df2[col].sum()
+# Number of DF1 quantile bins the drift metrics of numeric columns are computed on
+_DRIFT_BINS = 10
+# Floor of the bin proportions in the PSI, which is infinite for empty bins
+_DRIFT_MIN_PROPORTION = 1e-4
 
-            outliers_df1 = _calculate_outliers(df1, col).to_json()
-            outliers_df2 = _calculate_outliers(df2, col).to_json()
-        else:
-            median_df1 = median_df2 = mean_df1 = mean_df2 = std_df1 = std_df2 = sum_df1 = sum_df2 = None
-            outliers_df1 = outliers_df2 = None
+def _distribution_drift(counts1, counts2, ordered):
+    """
+    This function computes the drift metrics between two histograms over the same bins: the population stability
+    index, the Kolmogorov-Smirnov statistic at the bin edges (only for ordered bins) and the Jensen-Shannon
+    divergence in bits.
+    """
+    total1, total2 = counts1.sum(), counts2.sum()
+    if not total1 or not total2:
+        return np.nan, np.nan, np.nan
+    p = counts1 / total1
+    q = counts2 / total2
+
+    floored_p = np.maximum(p, _DRIFT_MIN_PROPORTION)
+    floored_q = np.maximum(q, _DRIFT_MIN_PROPORTION)
+    psi = ((floored_q - floored_p) * np.log(floored_q / floored_p)).sum()
+
+    ks = np.abs(np.cumsum(p) - np.cumsum(q)).max() if ordered else np.nan
+
+    m = (p + q) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        js = 0.5 * np.where(p > 0, p * np.log2(p / m), 0).sum() + 0.5 * np.where(q > 0, q * np.log2(q / m), 0).sum()
+
+    return psi, ks, js
+
+def _drift_bins(values):
+    """
+    This function bins an array of non-null numbers on its deciles for the drift metrics, and returns
+    the bin edges and the counts per bin, or None if the array is empty.
+    """
+    if not len(values):
+        return None
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, _DRIFT_BINS + 1))[1:-1])
+    return edges, np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+def _numeric_drift(values1, values2, bins1=None):
+    """
+    This function computes the drift metrics of two arrays of non-null numbers, binned on the deciles of values1.
+    Values outside values1's range fall in the first or last bin. The _drift_bins of values1 can be passed
+    instead of values1 to avoid binning it again.
+    """
+    if bins1 is None:
+        bins1 = _drift_bins(values1)
+    if bins1 is None or not len(values2):
+        return np.nan, np.nan, np.nan
+    edges, counts1 = bins1
+    counts2 = np.bincount(np.searchsorted(edges, values2, side='right'), minlength=len(edges) + 1)
+    return _distribution_drift(counts1, counts2, ordered=True)
+
+def _categorical_drift(counts1, counts2):
+    """
+    This function computes the drift metrics of two {value: count} frequency tables, binned on the values of
+    counts1. Values only seen in counts2 share one extra bin.
+    """
+    categories = list(counts1)
+    unseen = sum(count for value, count in counts2.items() if value not in counts1)
+    histogram1 = np.array([counts1[value] for value in categories] + [0], dtype=np.float64)
+    histogram2 = np.array([counts2.get(value, 0) for value in categories] + [unseen], dtype=np.float64)
+    return _distribution_drift(histogram1, histogram2, ordered=False)
+
+def _column_drift(series1, series2, counts1=None, counts2=None, bins1=None):
+    """
+    This function computes the PSI, KS statistic and JS divergence of a column from df1 to df2.
+    Numbers are binned on df1's deciles, other values by their frequencies; the KS statistic is only
+    reported for numbers. The value counts of non-numeric columns from _value_counts, and the _drift_bins
+    of numeric columns of df1, can be passed to avoid computing them again.
+    """
+    if pd.api.types.is_numeric_dtype(series1) and pd.api.types.is_numeric_dtype(series2):
+        values1 = series1.dropna().to_numpy(dtype=np.float64) if bins1 is None else None
+        return _numeric_drift(values1, series2.dropna().to_numpy(dtype=np.float64), bins1)
+    if counts1 is None:
+        counts1 = _value_counts(series1)
+    if counts2 is None:
+        counts2 = _value_counts(series2)
+    return _categorical_drift(counts1.to_dict(), counts2.to_dict())
+
+# Drift metrics reported at the end of the column summary
+_DRIFT_METRICS = ['PSI', 'KS Statistic', 'JS Divergence']
+
+# Order of the per-dataframe statistics in the column summary, each reported for DF1 then DF2
+_PROFILE_STATS = ['non_null_rows', 'distinct_values', 'median', 'mean', 'std', 'sum', 'top_values', 'outliers']
+
+def _compare_dataframes(df1, df2, profile_df1=None, masks=None, progress=None):
+    """
+    This function compares the two given dataframes column by column.
+    A profile of df1 computed by _profile_dataframe can be passed to avoid recomputing it, including the
+    value counts and decile bins of the drift metrics.
+    The difference mask of each column is stored in masks if given, to be shared with RowDiffs.
+    A _Progress is updated after each column if given.
+    """
+    column_diffs = []
+    if masks is None:
+        masks = {}
+
+    for col in df1.columns:
+        # String and other non-numeric columns are encoded once, comparisons and counts then run on the codes
+        numeric = _is_numeric_pair(df1[col], df2[col])
+        codes = None if numeric else _shared_codes(df1[col], df2[col])
+        codes1, codes2, uniques = codes if codes is not None else (None, None, None)
+        profile1 = profile_df1.get(col) if profile_df1 is not None else None
+        # The value counts of other columns are shared by the profiles and the drift metrics
+        counts1 = counts2 = None
+        if not numeric:
+            counts1 = _value_counts(df1[col], codes1, uniques) if profile1 is None else profile1['value_counts']
+            counts2 = _value_counts(df2[col], codes2, uniques)
+
+        if col not in masks:
+            masks[col] = _difference_mask(df1[col], df2[col], codes)
+        col_diff = masks[col].sum()
+        per_diff = col_diff / len(df1) * 100
+        changes_summary_json = _calculate_changes_summary(df1, df2, col, masks[col], codes)
+
+        if profile1 is None:
+            profile1 = _profile_column(df1, col, counts1)
+        profile2 = _profile_column(df2, col, counts2)
 
-        column_diffs.append([col, col_diff, per_diff, changes_summary_json, non_null_rows_df1, non_null_rows_df2, distinct_values_df1, distinct_values_df2, median_df1, median_df2, mean_df1, mean_df2, std_df1, std_df2, sum_df1, sum_df2, top_values_df1, top_values_df2, outliers_df1, outliers_df2])
+        column_diffs.append([col, col_diff, per_diff, changes_summary_json] +
+                            [stat for key in _PROFILE_STATS for stat in (profile1[key], profile2[key])] +
+                            list(_column_drift(df1[col], df2[col], counts1, counts2, profile1['drift_bins'])))
+        if progress is not None:
+            progress.update(columns_done=len(column_diffs))
 
     return column_diffs
 
+class RowDiffs:
+    """
+    Lazy row-wise comparison of two aligned dataframes, holding the same data as the row_diffs dataframe
+    returned by compare_datasets without building it. Only references to the inputs are kept, difference masks
+    are computed once per column when first needed (or shared by the caller through masks), and columns,
+    rows or slices are materialized on access.
+
+    - row_diffs['A_df1'], row_diffs[['All_isequal', 'A_isequal']]: materialize some columns
+    - row_diffs.differing_rows(): materialize the rows where All_isequal is False
+    - row_diffs.to_frame(columns, rows): materialize a subset of columns and/or rows (a slice or boolean mask)
+    - row_diffs.iter_batches(batch_size): stream the frame in batches, e.g. to write_row_diffs
+    """
+    def __init__(self, df1, df2, masks=None):
+        self.df1 = df1
+        self.df2 = df2
+        self.compared_columns = list(df1.columns)
+        self.columns = ['All_isequal'] + [col + suffix for col in self.compared_columns for suffix in ('_df1', '_df2', '_isequal')]
+        self._masks = {} if masks is None else masks
+        self._all_isequal = None
+
+    def __len__(self):
+        return len(self.df1)
+
+    def __repr__(self):
+        return f"RowDiffs({len(self)} rows, {len(self.compared_columns)} compared columns)"
+
+    def isequal(self, col):
+        """
+        Returns the equality mask of a compared column as a boolean array.
+        """
+        if col not in self._masks:
+            self._masks[col] = _difference_mask(self.df1[col], self.df2[col])
+        return ~self._masks[col]
+
+    def all_isequal(self):
+        """
+        Returns the mask of the rows where all columns are equal, as a boolean array.
+        """
+        if self._all_isequal is None:
+            differs = np.zeros(len(self), dtype=bool)
+            for col in self.compared_columns:
+                self.isequal(col)
+                differs |= self._masks[col]
+            self._all_isequal = ~differs
+        return self._all_isequal
+
+    def _column(self, name, rows):
+        if name == 'All_isequal':
+            return self.all_isequal()[rows]
+        col, _, suffix = name.rpartition('_')
+        if col not in self.compared_columns or suffix not in ('df1', 'df2', 'isequal'):
+            raise KeyError(name)
+        if suffix == 'isequal':
+            return self.isequal(col)[rows]
+        source = self.df1 if suffix == 'df1' else self.df2
+        # The extension array keeps dtypes like categoricals intact
+        return source[col].iloc[rows].array
+
+    def to_frame(self, columns=None, rows=slice(None)):
+        """
+        Materializes the given columns (all by default) for the given rows, a slice or a boolean mask
+        (all rows by default).
+        """
+        columns = self.columns if columns is None else columns
+        index = self.df1.index[rows]
+        return pd.DataFrame({name: self._column(name, rows) for name in columns}, index=index, columns=columns)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return pd.Series(self._column(key, slice(None)), index=self.df1.index, name=key)
+        return self.to_frame(list(key))
+
+    def differing_rows(self, columns=None):
+        """
+        Materializes the rows where at least one column differs.
+        """
+        return self.to_frame(columns, ~self.all_isequal())
+
+    def iter_batches(self, batch_size=100000, columns=None, only_differences=False):
+        """
+        Yields the row differences in batches of batch_size rows, optionally only the differing rows.
+        """
+        for start in range(0, max(len(self), 1), batch_size):
+            rows = slice(start, start + batch_size)
+            if only_differences:
+                rows = np.arange(start, min(start + batch_size, len(self)))[~self.all_isequal()[rows]]
+            yield self.to_frame(columns, rows)
+
 def _diff_rows(df1, df2):
     """
     This function compares two dataframes row-wise.
     """
-    row_diffs = pd.DataFrame()
-    row_diffs['All_isequal'] = (df1 == df2).all(axis=1)
+    return RowDiffs(df1, df2).to_frame()
 
-    for col in df1.columns:
-        row_diffs[col+'_df1'] = df1[col]
-        row_diffs[col+'_df2'] = df2[col]
-        row_diffs[col+'_isequal'] = df1[col] == df2[col]
-
-    return row_diffs
+class SpilledRowDiffs:
+    """
+    Row differences spilled to disk by compare_datasets when they don't fit in its memory_limit. The rows are
+    stored in order as a series of chunks in a temporary directory, removed by close (or on leaving a with
+    block, or at the latest when the object is garbage collected), and offer the same accessors as RowDiffs,
+    reading only the chunks and columns needed.
+    """
+    def __init__(self, directory, columns, rows):
+        self._directory = directory
+        self.columns = list(columns)
+        self.compared_columns = [name[:-len('_isequal')] for name in self.columns[1:] if name.endswith('_isequal')]
+        self._rows = rows
+
+    @property
+    def path(self):
+        return self._directory.name
+
+    def __len__(self):
+        return self._rows
+
+    def close(self):
+        """
+        Removes the spilled chunks, after which the row differences can no longer be read.
+        """
+        self._directory.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"SpilledRowDiffs({len(self)} rows, {len(self.compared_columns)} compared columns, at '{self.path}')"
+
+    def _chunks(self, columns=None):
+        rows_dir = os.path.join(self.path, 'rows')
+        for name in sorted(os.listdir(rows_dir)):
+            yield _read_spilled(os.path.join(rows_dir, name), columns)
+
+    def isequal(self, col):
+        """
+        Returns the equality mask of a compared column as a boolean array.
+        """
+        return self[col + '_isequal'].to_numpy(dtype=bool)
+
+    def all_isequal(self):
+        """
+        Returns the mask of the rows where all columns are equal, as a boolean array.
+        """
+        return self['All_isequal'].to_numpy(dtype=bool)
+
+    def to_frame(self, columns=None, rows=slice(None)):
+        """
+        Reads the given columns (all by default) for the given rows, a slice or a boolean mask (all rows by default).
+        """
+        columns = self.columns if columns is None else list(columns)
+        return pd.concat(list(self._chunks(columns))).iloc[rows]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.to_frame([key])[key]
+        return self.to_frame(list(key))
+
+    def differing_rows(self, columns=None):
+        """
+        Reads the rows where at least one column differs.
+        """
+        return pd.concat(list(self.iter_batches(columns=columns, only_differences=True)))
+
+    def iter_batches(self, batch_size=100000, columns=None, only_differences=False):
+        """
+        Yields the row differences in batches of at most batch_size rows, optionally only the differing rows.
+        """
+        columns = self.columns if columns is None else list(columns)
+        read_columns = columns if not only_differences or 'All_isequal' in columns else ['All_isequal'] + columns
+        for chunk in self._chunks(read_columns):
+            if only_differences:
+                chunk = chunk[~chunk['All_isequal'].to_numpy(dtype=bool)][columns]
+            for start in range(0, max(len(chunk), 1), batch_size):
+                yield chunk.iloc[start:start + batch_size]
 
 def _check_column_presence(columns, new_cols_in_df1, new_cols_in_df2):
     """
@@ -161,59 +659,1984 @@ def _check_column_presence(columns, new_cols_in_df1, new_cols_in_df2):
 
     return column_presence
 
-def _load_datasets(df1, df2):
-    if not isinstance(df1, (str, pd.DataFrame)) or not isinstance(df2, (str, pd.DataFrame)):
-        raise ValueError("Input arguments must be either two strings or two pandas.DataFrame instances.")
+_INTEGER_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+def _smallest_integer_dtype(min_value, max_value):
+    """
+    This function returns the smallest signed integer dtype that can hold values between min_value and max_value.
+    """
+    for dtype in _INTEGER_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def optimize_memory(df1, df2, max_category_ratio=0.5):
+    """
+    Reduces the memory footprint of two dataframes that are about to be compared.
+    String columns with few distinct values are converted to categoricals sharing the same categories in both
+    dataframes, so equality checks compare integer codes. Integer columns are downcast to the smallest integer
+    type holding the values of both dataframes. Floats are left as they are, since downcasting them is lossy.
+    Only columns with the same dtype in both dataframes are converted, the input dataframes are not modified.
+
+    Parameters:
+    - df1, df2 (pd.DataFrame): The input dataframes.
+    - max_category_ratio (float): Maximum ratio of distinct values to non-null values for a string column
+      to be converted to a categorical.
+
+    Returns the optimized dataframes and a report dataframe with the dtype and memory usage (bytes, both
+    dataframes combined) of each column before and after.
+    """
+    memory_before = df1.memory_usage(deep=True, index=False).add(df2.memory_usage(deep=True, index=False), fill_value=0)
+
+    df1 = df1.copy(deep=False)
+    df2 = df2.copy(deep=False)
+    dtypes_before = df1.dtypes.combine_first(df2.dtypes)
+
+    for col in df1.columns.intersection(df2.columns):
+        if df1[col].dtype != df2[col].dtype:
+            continue
+
+        if pd.api.types.is_integer_dtype(df1[col].dtype) and not pd.api.types.is_extension_array_dtype(df1[col].dtype):
+            values = [series for series in (df1[col], df2[col]) if len(series)]
+            if not values:
+                continue
+            dtype = _smallest_integer_dtype(min(series.min() for series in values), max(series.max() for series in values))
+            df1[col] = df1[col].astype(dtype)
+            df2[col] = df2[col].astype(dtype)
+
+        elif pd.api.types.is_object_dtype(df1[col].dtype) or pd.api.types.is_string_dtype(df1[col].dtype):
+            non_null = df1[col].count() + df2[col].count()
+            categories = pd.concat([df1[col], df2[col]], ignore_index=True).dropna().unique()
+            if non_null == 0 or len(categories) / non_null > max_category_ratio:
+                continue
+            dtype = pd.CategoricalDtype(categories)
+            df1[col] = df1[col].astype(dtype)
+            df2[col] = df2[col].astype(dtype)
+
+    memory_after = df1.memory_usage(deep=True, index=False).add(df2.memory_usage(deep=True, index=False), fill_value=0)
+    report = pd.DataFrame({
+        'Dtype Before': dtypes_before,
+        'Dtype After': df1.dtypes.combine_first(df2.dtypes),
+        'Memory Before': memory_before,
+        'Memory After': memory_after})
+    report.index.name = 'Column'
+    report = report.reset_index()
+
+    return df1, df2, report
+
+def _load_dataset(df):
+    """
+    This function loads a single dataset, given as a path to a CSV file, a SqlTable or a pandas DataFrame.
+    """
+    if not isinstance(df, (str, SqlTable, pd.DataFrame)):
+        raise ValueError("Input arguments must be either strings, SqlTable or pandas.DataFrame instances.")
 
     # Load CSV file if string is given
-    if isinstance(df1, str):
-        df1 = _read_csv(df1)
-    if isinstance(df2, str):
-        df2 = _read_csv(df2)
+    if isinstance(df, str):
+        df = _read_csv(df)
+    elif isinstance(df, SqlTable):
+        df = _read_sql_table(df)
+
+    return df
+
+def _read_csvs_concurrently(filepath1, filepath2):
+    """
+    This function reads two csv files at the same time in two threads. CSV parsing mostly runs in native code
+    that releases the GIL, so reading both files takes about as long as reading the larger one.
+    If one of the reads fails the error is raised right away, without waiting for the other file.
+    """
+    executor = ThreadPoolExecutor(max_workers=2)
+    futures = [executor.submit(_read_csv, filepath1), executor.submit(_read_csv, filepath2)]
+    try:
+        wait(futures, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        return futures[0].result(), futures[1].result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _load_datasets(df1, df2, optimize_dtypes=False):
+    if not isinstance(df1, (str, SqlTable, pd.DataFrame)) or not isinstance(df2, (str, SqlTable, pd.DataFrame)):
+        raise ValueError("Input arguments must be either two strings, two SqlTable or two pandas.DataFrame instances.")
+
+    if isinstance(df1, str) and isinstance(df2, str):
+        df1, df2 = _read_csvs_concurrently(df1, df2)
+    else:
+        df1 = _load_dataset(df1)
+        df2 = _load_dataset(df2)
+
+    if optimize_dtypes:
+        df1, df2, report = optimize_memory(df1, df2)
+        saved = report['Memory Before'].sum() - report['Memory After'].sum()
+        logger.info(f"Optimized dtypes of {(report['Dtype Before'] != report['Dtype After']).sum()} columns, "
+                    f"saving {saved / 2**20:.1f} MiB ({saved / max(report['Memory Before'].sum(), 1) * 100:.1f}%)")
 
     return df1, df2
 
-def compare_datasets(df1, df2):
+_COL_SUMMARY_COLUMNS = [
+    'Column',
+    'Number of Differences',
+    'Percentage of Differences',
+    'Top 5 Changes',
+    'Non-null Rows DF1',
+    'Non-null Rows DF2',
+    'Distinct Values DF1',
+    'Distinct Values DF2',
+    'Median DF1',
+    'Median DF2',
+    'Mean DF1',
+    'Mean DF2',
+    'Std Dev DF1',
+    'Std Dev DF2',
+    'Sum DF1',
+    'Sum DF2',
+    'Top 5 values DF1',
+    'Top 5 values DF2',
+    'Outliers DF1',
+    'Outliers DF2'] + _DRIFT_METRICS
+
+def _build_col_summary(column_diffs, columns, new_cols_in_df1, new_cols_in_df2):
     """
-    This function checks the type of the input and compares the two input datasets.
+    This function turns the output of _compare_dataframes into the column summary dataframe.
     """
-    df1, df2 = _load_datasets(df1, df2)
-    df1, df2, new_cols_in_df1, new_cols_in_df2 = _ensure_same_shape(df1, df2)
+    col_summary = pd.DataFrame(column_diffs, columns=_COL_SUMMARY_COLUMNS)
+    col_summary['Column Presence'] = _check_column_presence(columns, new_cols_in_df1, new_cols_in_df2)
+    return col_summary
+
+def _sample_positions(df, sample, sample_key=None, random_state=None):
+    """
+    This function picks the row positions of a sample, given either as a number of rows (int) or a fraction (float).
+    Without sample_key rows are picked uniformly at random. With sample_key, rows are picked by hashing the
+    key column(s), so the same keys are sampled on every run regardless of row order.
+    """
+    if isinstance(sample, float):
+        if not 0 < sample <= 1:
+            raise ValueError(f"A sample fraction must be between 0 and 1, got {sample}.")
+        fraction = sample
+    else:
+        if sample < 1:
+            raise ValueError(f"A sample size must be at least 1 row, got {sample}.")
+        fraction = min(sample / max(len(df), 1), 1.0)
 
-    column_diffs = _compare_dataframes(df1, df2)
-    col_summary = pd.DataFrame(column_diffs, columns=[
+    if fraction >= 1:
+        return np.arange(len(df))
+
+    if sample_key is None:
+        size = min(sample, len(df)) if not isinstance(sample, float) else int(round(fraction * len(df)))
+        rng = np.random.default_rng(random_state)
+        return np.sort(rng.choice(len(df), size=size, replace=False))
+
+    hashes = pd.util.hash_pandas_object(df[sample_key], index=False).values
+    return np.flatnonzero(hashes < np.uint64(fraction * 2**64))
+
+def _wilson_interval(successes, n, population, confidence):
+    """
+    This function calculates the Wilson score interval of a proportion observed in a sample of n rows
+    out of population rows, with a finite population correction.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    if n >= population:
+        return p, p
+
+    # The finite population correction shrinks the variance, which is the same as growing the sample size
+    n_eff = n * (population - 1) / (population - n)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    denominator = 1 + z**2 / n_eff
+    center = (p + z**2 / (2 * n_eff)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / n_eff + z**2 / (4 * n_eff**2)) / denominator
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+def _estimate_differences(df1, df2, population, confidence):
+    """
+    This function estimates the number and percentage of differences per column in the full datasets
+    from sampled rows, with confidence intervals.
+    """
+    column_estimates = []
+    n = len(df1)
+
+    for col in df1.columns:
+        col_diff = _difference_mask(df1[col], df2[col]).sum()
+        lower, upper = _wilson_interval(col_diff, n, population, confidence)
+        share = col_diff / n if n else 0.0
+        column_estimates.append([col, n, col_diff, share * population, share * 100, lower * 100, upper * 100])
+
+    return pd.DataFrame(column_estimates, columns=[
         'Column',
-        'Number of Differences',
-        'Percentage of Differences',
-        'Top 5 Changes',
-        'Non-null Rows DF1',
-        'Non-null Rows DF2',
-        'Distinct Values DF1',
-        'Distinct Values DF2',
-        'Median DF1',
-        'Median DF2',
-        'Mean DF1',
-        'Mean DF2',
-        'Std Dev DF1',
-        'Std Dev DF2',
-        'Sum DF1',
-        'Sum DF2',
-        'Top 5 values DF1',
-        'Top 5 values DF2',
-        'Outliers DF1',
-        'Outliers DF2'])
-    col_summary['Column Presence'] = _check_column_presence(df1.columns, new_cols_in_df1, new_cols_in_df2)
-
-    row_diffs = _diff_rows(df1, df2)
+        'Sampled Rows',
+        'Sampled Differences',
+        'Estimated Number of Differences',
+        'Estimated Percentage of Differences',
+        'Percentage CI Lower',
+        'Percentage CI Upper'])
+
+# Bump when the comparison output changes, so stale cached results are not returned
+_CACHE_VERSION = 5
+_HASH_BLOCK_SIZE = 2**20
+
+def _hash_file(path):
+    """
+    This function hashes the content of a file, reading it in blocks.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
+def _dataset_fingerprint(df, cache_dir):
+    """
+    This function returns a hash of a dataset's content, or None if the dataset can't be fingerprinted.
+    File hashes are remembered in the cache directory with the file's size and modification time,
+    so unchanged files are not read again.
+    """
+    if isinstance(df, pd.DataFrame):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        digest.update(repr(list(df.columns)).encode())
+        digest.update(repr(list(df.dtypes.astype(str))).encode())
+        return digest.hexdigest()
+
+    if not isinstance(df, str):
+        return None
+
+    index_path = os.path.join(cache_dir, 'file_hashes.json')
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        index = {}
+
+    try:
+        stat = os.stat(df)
+    except FileNotFoundError:
+        raise ValueError(f"No file found at path '{df}'")
+    path = os.path.abspath(df)
+    entry = index.get(path)
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['hash']
+
+    index[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': _hash_file(df)}
+    temp_path = f'{index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(temp_path, index_path)
+    return index[path]['hash']
+
+def _cache_key(df1, df2, cache_dir, parameters):
+    """
+    This function returns the cache key of a comparison, or None if it can't be cached.
+    """
+    fingerprint1 = _dataset_fingerprint(df1, cache_dir)
+    fingerprint2 = _dataset_fingerprint(df2, cache_dir)
+    if fingerprint1 is None or fingerprint2 is None:
+        return None
+    key = json.dumps([_CACHE_VERSION, fingerprint1, fingerprint2, parameters], default=str)
+    return hashlib.blake2b(key.encode(), digest_size=20).hexdigest()
+
+def _cache_load(cache_dir, key):
+    """
+    This function returns the cached column summary and row differences, or None on a cache miss.
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    try:
+        col_summary = pd.read_pickle(os.path.join(entry_dir, 'col_summary.pkl'))
+        if os.path.exists(os.path.join(entry_dir, 'row_diffs.parquet')):
+            row_diffs = pd.read_parquet(os.path.join(entry_dir, 'row_diffs.parquet'))
+        else:
+            row_diffs = pd.read_pickle(os.path.join(entry_dir, 'row_diffs.pkl.gz'))
+    except FileNotFoundError:
+        return None
+
+    # The entry's modification time records its last use, for the LRU eviction
+    os.utime(entry_dir)
     return col_summary, row_diffs
 
-def detect_anomalies(df1, df2, column_list=None, contamination=0.005):
+def _cache_store(cache_dir, key, col_summary, row_diffs, size_limit):
+    """
+    This function stores a comparison result in the cache, then evicts the least recently used entries
+    until the cache fits in size_limit bytes. Row differences are stored as zstd-compressed Parquet
+    when possible, and as a gzip-compressed pickle otherwise. Object columns are always pickled: Parquet reads
+    their nulls back as None whatever they were (NaN, pd.NA), so a cache hit would not match the uncached result.
+    """
+    temp_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    col_summary.to_pickle(os.path.join(temp_dir, 'col_summary.pkl'))
+    try:
+        if (row_diffs.dtypes == object).any():
+            raise TypeError("the row differences have object columns")
+        row_diffs.to_parquet(os.path.join(temp_dir, 'row_diffs.parquet'), compression='zstd')
+    except (ImportError, ValueError, TypeError) as e:
+        logger.debug(f"Pickling row differences, they can't be stored as Parquet: {e}")
+        if os.path.exists(os.path.join(temp_dir, 'row_diffs.parquet')):
+            os.remove(os.path.join(temp_dir, 'row_diffs.parquet'))
+        row_diffs.to_pickle(os.path.join(temp_dir, 'row_diffs.pkl.gz'), compression={'method': 'gzip', 'compresslevel': 1})
+
+    entry_dir = os.path.join(cache_dir, key)
+    try:
+        os.replace(temp_dir, entry_dir)
+    except OSError:
+        # Another process stored the same result first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isdir(path) and not name.startswith('.'):
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= size_limit:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+# Smallest chunk compared at once when the datasets barely fit in memory_limit
+_MIN_SPILL_CHUNK_ROWS = 1000
+
+def _memory_footprint(df1, df2):
+    """
+    This function estimates the memory needed to compare two aligned dataframes in memory: the loaded frames,
+    and on top of them the difference masks, the changed values and the materialized row differences.
+    Returns the bytes already used by the loaded frames and the bytes needed per row by the comparison.
+    """
+    loaded = int(df1.memory_usage(deep=True).sum() + df2.memory_usage(deep=True).sum())
+    columns = len(df1.columns)
+    # Row differences hold both frames' values, their masks and All_isequal; changes hold at most both values again
+    per_row = 2 * loaded / max(len(df1), 1) + 2 * columns + 1
+    return loaded, per_row
+
+def _spill_frame(frame, path):
+    """
+    This function writes a dataframe to a temporary Parquet file, keeping its dtypes and index.
+    Frames with object columns are pickled instead: Parquet reads their nulls back as None whatever they
+    were (NaN, pd.NA) and can't represent mixed types, so they would not read back as compared in memory.
+    """
+    if (frame.dtypes == object).any():
+        frame.to_pickle(path + '.pkl')
+        return
+    pa, pq = _import_pyarrow()
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        frame.to_pickle(path + '.pkl')
+        return
+    pq.write_table(table, path + '.parquet', compression='zstd')
+
+def _read_spilled(path, columns=None):
+    """
+    This function reads back a dataframe written by _spill_frame.
+    """
+    if path.endswith('.pkl'):
+        frame = pd.read_pickle(path)
+        return frame if columns is None else frame[columns]
+    _, pq = _import_pyarrow()
+    return pq.read_pandas(path, columns=columns).to_pandas()
+
+def _compare_spilled(df1, df2, chunk_rows, progress=None, cancel=None):
+    """
+    This function compares two aligned dataframes chunk by chunk of chunk_rows rows, spilling the row differences
+    and the changed values of each column to temporary Parquet files instead of keeping them in memory.
+    Returns the same column differences as _compare_dataframes and the row differences as SpilledRowDiffs.
+    The temporary files are removed if the comparison fails or is cancelled.
+    """
+    directory = tempfile.TemporaryDirectory(prefix='datacompare-')
+    try:
+        return _compare_spilled_into(directory, df1, df2, chunk_rows, progress, cancel)
+    except BaseException:
+        directory.cleanup()
+        raise
+
+def _compare_spilled_into(directory, df1, df2, chunk_rows, progress, cancel):
+    rows_dir = os.path.join(directory.name, 'rows')
+    changes_dir = os.path.join(directory.name, 'changes')
+    os.makedirs(rows_dir)
+    os.makedirs(changes_dir)
+
+    columns = list(df1.columns)
+    differences = {col: 0 for col in columns}
+    compare_progress = _Progress(progress, cancel, 'compare', len(df1), len(columns))
+    for chunk, start in enumerate(range(0, max(len(df1), 1), chunk_rows)):
+        chunk1 = df1.iloc[start:start + chunk_rows]
+        chunk2 = df2.iloc[start:start + chunk_rows]
+        masks = {col: _difference_mask(chunk1[col], chunk2[col]) for col in columns}
+
+        for i, col in enumerate(columns):
+            differences[col] += masks[col].sum()
+            if masks[col].any():
+                changed = pd.DataFrame({'from': chunk1[col][masks[col]], 'to': chunk2[col][masks[col]]})
+                _spill_frame(changed, os.path.join(changes_dir, f'{i:05d}-{chunk:08d}'))
+
+        row_diffs = RowDiffs(chunk1, chunk2, masks)
+        _spill_frame(row_diffs.to_frame(), os.path.join(rows_dir, f'{chunk:08d}'))
+        del masks, row_diffs
+        compare_progress.update(rows_done=start + len(chunk1))
+
+    spilled = sorted(os.listdir(changes_dir))
+    summary_progress = _Progress(progress, cancel, 'summary', len(df1), len(columns))
+    column_diffs = []
+    for i, col in enumerate(columns):
+        # The changes of one column are read back together to count them exactly, like in memory
+        parts = [_read_spilled(os.path.join(changes_dir, name)) for name in spilled if name.startswith(f'{i:05d}-')]
+        if parts:
+            changed = pd.concat(parts)
+        else:
+            changed = pd.DataFrame({'from': df1[col].iloc[:0], 'to': df2[col].iloc[:0]})
+        changes_summary_json = _calculate_changes_summary(changed[['from']].rename(columns={'from': col}),
+                                                          changed[['to']].rename(columns={'to': col}),
+                                                          col, np.ones(len(changed), dtype=bool))
+        del parts, changed
+
+        counts1, counts2 = _value_counts(df1[col]), _value_counts(df2[col])
+        profile1 = _profile_column(df1, col, counts1)
+        profile2 = _profile_column(df2, col, counts2)
+        column_diffs.append([col, differences[col], differences[col] / len(df1) * 100, changes_summary_json] +
+                            [stat for key in _PROFILE_STATS for stat in (profile1[key], profile2[key])] +
+                            list(_column_drift(df1[col], df2[col], counts1, counts2)))
+        summary_progress.update(columns_done=i + 1)
+
+    row_diffs = SpilledRowDiffs(directory, RowDiffs(df1.iloc[:0], df2.iloc[:0]).columns, len(df1))
+    shutil.rmtree(changes_dir)
+    return column_diffs, row_diffs
+
+def compare_datasets(df1, df2, optimize_dtypes=False, sample=None, sample_key=None, confidence=0.95, random_state=None, lazy=False,
+                     cache_dir=None, cache_size_limit=2**30, memory_limit=None, progress=None, cancel=None):
+    """
+    This function checks the type of the input and compares the two input datasets.
+    With optimize_dtypes, low-cardinality strings and integers are converted to compact dtypes at load
+    (see optimize_memory) and the memory saved is logged.
+
+    With sample, only a sample of the rows is compared, for a quick estimate of the differences: sample is a
+    number of rows (int) or a fraction of the rows (float). Rows are sampled at random (reproducible with
+    random_state), or by hashing the sample_key column(s) so the same keys are picked on every run.
+    The column summary then holds, per column, the estimated number and percentage of differences with a
+    confidence interval at the given confidence level, and row_diffs only holds the sampled rows.
+
+    With lazy, row_diffs is returned as a RowDiffs object that materializes columns and rows only when accessed.
+
+    With cache_dir, results are cached on disk, keyed by the content of the inputs and the comparison parameters,
+    and returned from the cache when the same comparison is run again. File contents are only hashed again when
+    a file's size or modification time changed. The cache is trimmed to cache_size_limit bytes by evicting the
+    least recently used results. Lazy comparisons, database inputs and unseeded random samples are not cached.
+
+    With memory_limit (in bytes), the footprint of the loaded datasets, difference masks and row differences is
+    estimated before comparing. If the in-memory comparison would not fit, rows are compared in chunks sized to
+    the remaining budget, changed values and row differences are spilled to temporary Parquet files, and
+    row_diffs is returned as a SpilledRowDiffs reading them back on access. The results are the same as in memory.
+    Comparisons with a memory_limit are not cached.
+
+    With progress, a callable, progress events are reported for each phase ('load', then 'compare' column by
+    column, 'row_diffs'; or 'compare' chunk by chunk then 'summary' when spilling): a dict with the phase, rows
+    and columns done and total, elapsed seconds, rows per second and the estimated seconds left in the phase.
+    With cancel, a threading.Event, the comparison stops with ComparisonCancelled between columns or chunks
+    once the event is set, without leaving temporary files behind.
+    """
+    cacheable = not lazy and memory_limit is None and (sample is None or sample_key is not None or random_state is not None)
+    if cache_dir is not None and cacheable:
+        os.makedirs(cache_dir, exist_ok=True)
+        key = _cache_key(df1, df2, cache_dir, [optimize_dtypes, sample, sample_key, confidence, random_state])
+        if key is not None:
+            cached = _cache_load(cache_dir, key)
+            if cached is not None:
+                return cached
+
+            col_summary, row_diffs = compare_datasets(df1, df2, optimize_dtypes, sample, sample_key, confidence, random_state,
+                                                      progress=progress, cancel=cancel)
+            _cache_store(cache_dir, key, col_summary, row_diffs, cache_size_limit)
+            return col_summary, row_diffs
+
+    load_progress = _Progress(progress, cancel, 'load', 0)
+    df1, df2 = _load_datasets(df1, df2, optimize_dtypes)
+    df1, df2, new_cols_in_df1, new_cols_in_df2 = _ensure_same_shape(df1, df2)
+    load_progress.rows_total = len(df1)
+    load_progress.update(rows_done=len(df1))
+
+    if sample is not None:
+        positions = _sample_positions(df1, sample, sample_key, random_state)
+        sample_df1 = df1.iloc[positions]
+        sample_df2 = df2.iloc[positions]
+
+        col_summary = _estimate_differences(sample_df1, sample_df2, len(df1), confidence)
+        col_summary['Column Presence'] = _check_column_presence(df1.columns, new_cols_in_df1, new_cols_in_df2)
+
+        row_diffs = RowDiffs(sample_df1, sample_df2)
+        return col_summary, row_diffs if lazy else row_diffs.to_frame()
+
+    if memory_limit is not None:
+        loaded, per_row = _memory_footprint(df1, df2)
+        available = memory_limit - loaded
+        logger.info(f"Loaded datasets use {loaded / 2**20:.1f} MiB, comparing them in memory needs {per_row * len(df1) / 2**20:.1f} MiB more "
+                    f"out of {max(available, 0) / 2**20:.1f} MiB left in the memory limit")
+        if per_row * len(df1) > available:
+            if available <= 0:
+                logger.warning("The loaded datasets alone exceed memory_limit, comparing them in the smallest chunks")
+            chunk_rows = max(int(available // per_row), _MIN_SPILL_CHUNK_ROWS)
+            logger.info(f"Comparing in chunks of {chunk_rows} rows, spilling intermediate results to disk")
+            column_diffs, row_diffs = _compare_spilled(df1, df2, chunk_rows, progress, cancel)
+            return _build_col_summary(column_diffs, df1.columns, new_cols_in_df1, new_cols_in_df2), row_diffs
+
+    masks = {}
+    column_diffs = _compare_dataframes(df1, df2, masks=masks, progress=_Progress(progress, cancel, 'compare', len(df1), len(df1.columns)))
+    col_summary = _build_col_summary(column_diffs, df1.columns, new_cols_in_df1, new_cols_in_df2)
+
+    row_diffs = RowDiffs(df1, df2, masks)
+    if lazy:
+        return col_summary, row_diffs
+
+    row_diffs_progress = _Progress(progress, cancel, 'row_diffs', len(df1))
+    row_diffs = row_diffs.to_frame()
+    row_diffs_progress.update(rows_done=len(df1))
+    return col_summary, row_diffs
+
+def _row_hashes(df):
+    """
+    This function hashes each full row of a dataframe into a 64-bit integer, ignoring the index.
+    """
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def _rows_only_in(df, counts, other_counts, hashes):
+    """
+    This function returns one row of df per row hash that is more frequent in counts than in other_counts,
+    with the difference in a 'Count' column.
+    """
+    excess = counts.sub(other_counts, fill_value=0)
+    excess = excess[excess > 0].astype('int64')
+    # The first row with each hash stands for all its copies
+    first = pd.Series(np.arange(len(hashes)), index=hashes)
+    first = first[~first.index.duplicated()]
+    rows = df.iloc[first[excess.index].to_numpy()]
+    return rows.assign(Count=excess.to_numpy())
+
+def compare_unordered(df1, df2):
+    """
+    Compares two datasets as multisets of rows, for extracts in no particular order and without a reliable key.
+    Every full row is hashed and the hashes are counted on each side, in time linear in the number of rows and
+    memory proportional to the number of distinct rows, without sorting either dataset. The row counts may differ.
+
+    Returns the rows found more often in df1 than in df2 and the rows found more often in df2 than in df1,
+    one row per distinct row with a 'Count' column holding how many more times it appears. Each row keeps the
+    index of its first occurrence. Datasets with a column named 'Count' are rejected, it would be overwritten.
+    """
     df1, df2 = _load_datasets(df1, df2)
+    if 'Count' in df1.columns or 'Count' in df2.columns:
+        raise ValueError("The datasets have a 'Count' column, which would be overwritten by the count of each row.")
+
+    df1, df2, _, _ = _align_frames(df1, df2)
+    columns = list(df1.columns)
+
+    # Numbers read as int on one side and as float on the other are hashed as floats on both, so equal values match
+    hashed1, hashed2 = df1, df2
+    numeric = [col for col in columns if df1[col].dtype != df2[col].dtype and
+               pd.api.types.is_numeric_dtype(df1[col]) and pd.api.types.is_numeric_dtype(df2[col])]
+    if numeric:
+        hashed1 = df1.astype({col: 'float64' for col in numeric})
+        hashed2 = df2.astype({col: 'float64' for col in numeric})
+
+    hashes1 = _row_hashes(hashed1)
+    hashes2 = _row_hashes(hashed2)
+    counts1 = pd.Series(hashes1).value_counts(sort=False)
+    counts2 = pd.Series(hashes2).value_counts(sort=False)
+
+    only_in_df1 = _rows_only_in(df1, counts1, counts2, hashes1)
+    only_in_df2 = _rows_only_in(df2, counts2, counts1, hashes2)
+    logger.info(f"{only_in_df1['Count'].sum()} rows are only in DataFrame 1 and {only_in_df2['Count'].sum()} rows only in DataFrame 2")
+
+    return only_in_df1, only_in_df2
+
+def _candidate_file_name(name):
+    """
+    This function turns a candidate name into a string usable as a file name.
+    """
+    return re.sub(r'[^\w.-]', '_', str(name))
+
+def compare_many(baseline, candidates, max_workers=None, output_dir=None, format='parquet'):
+    """
+    Compares one baseline dataset against several candidate datasets.
+    The baseline is loaded and profiled once, then each candidate is loaded and compared in turn,
+    or up to max_workers candidates at a time in a thread pool.
+
+    Parameters:
+    - baseline (str or pd.DataFrame): The reference dataset, compared as DF1.
+    - candidates (dict or list): The candidate datasets, compared as DF2. A dict maps candidate names to datasets,
+      in a list each candidate is named by its path, or by its position if it is a dataframe.
+    - max_workers (int): Number of candidates compared in parallel. Candidates are compared one by one if not set.
+    - output_dir (str): If set, the row differences of each candidate are written to
+      output_dir/row_differences_<candidate>.<format> with write_row_diffs instead of being kept in memory.
+    - format (str): 'parquet' or 'arrow', used with output_dir.
+
+    Returns the column summaries of all candidates in one dataframe, with a leading 'Candidate' column.
+    """
+    if isinstance(candidates, dict):
+        names = list(candidates.keys())
+        candidates = list(candidates.values())
+    else:
+        candidates = list(candidates)
+        names = [candidate if isinstance(candidate, str) else i for i, candidate in enumerate(candidates)]
+    if not candidates:
+        raise ValueError("At least one candidate dataset is required.")
+
+    if output_dir is not None:
+        _check_output_format(format)
+        os.makedirs(output_dir, exist_ok=True)
+
+    baseline = _load_dataset(baseline)
+    baseline_profile = _profile_dataframe(baseline)
+
+    def compare_candidate(name, candidate):
+        df1, df2, new_cols_in_df1, new_cols_in_df2 = _ensure_same_shape(baseline, _load_dataset(candidate))
+
+        masks = {}
+        column_diffs = _compare_dataframes(df1, df2, baseline_profile, masks)
+        col_summary = _build_col_summary(column_diffs, df1.columns, new_cols_in_df1, new_cols_in_df2)
+
+        if output_dir is not None:
+            path = os.path.join(output_dir, 'row_differences_' + _candidate_file_name(name) + _OUTPUT_EXTENSIONS[format])
+            write_row_diffs(RowDiffs(df1, df2, masks).iter_batches(), path, format)
+
+        return col_summary
+
+    if max_workers is None or max_workers <= 1:
+        summaries = [compare_candidate(name, candidate) for name, candidate in zip(names, candidates)]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            summaries = list(executor.map(compare_candidate, names, candidates))
+
+    for name, col_summary in zip(names, summaries):
+        col_summary.insert(0, 'Candidate', name)
+
+    return pd.concat(summaries, ignore_index=True)
 
-    # Making sure we're working with copies and don't modify original dataframes
-    df1 = df1.copy()
-    df2 = df2.copy()
+# Sizes of the mergeable sketches used by PartialSummary. Results are exact while a column has fewer
+# distinct values (or values, for quantiles and outliers) than the sketch holds.
+_DISTINCT_SKETCH_SIZE = 4096
+_QUANTILE_SAMPLE_SIZE = 10000
+_FREQUENCY_CAPACITY = 10000
+_EXTREMES_SIZE = 1000
+
+class _FrequencySketch:
+    """
+    Misra-Gries summary of the most frequent values. Counts are exact as long as fewer than capacity
+    distinct values were seen, otherwise they are lower bounds.
+    """
+    def __init__(self, counts, capacity=_FREQUENCY_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.update(counts)
+
+    def update(self, counts):
+        for value, count in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+
+        if len(self.counts) > self.capacity:
+            threshold = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = {value: count - threshold for value, count in self.counts.items() if count > threshold}
+
+    def merge(self, other):
+        self.update(other.counts)
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+class _DistinctSketch:
+    """
+    K-minimum-values sketch of the number of distinct values, exact below size distinct values.
+    """
+    def __init__(self, hashes, size=_DISTINCT_SKETCH_SIZE):
+        self.size = size
+        self.hashes = np.unique(hashes)[:size]
+
+    def merge(self, other):
+        self.hashes = np.union1d(self.hashes, other.hashes)[:self.size]
+
+    def estimate(self):
+        if len(self.hashes) < self.size:
+            return len(self.hashes)
+        return int(round((self.size - 1) / (float(self.hashes[-1]) / 2**64)))
+
+class _QuantileSketch:
+    """
+    Uniform sample of the values, merged by keeping the values with the smallest random priorities.
+    Holds every value, so quantiles are exact, as long as fewer than size values were seen.
+    """
+    def __init__(self, values, size=_QUANTILE_SAMPLE_SIZE):
+        self.size = size
+        self.values = values
+        self.priorities = np.random.default_rng().random(len(values))
+        self._trim()
+
+    def _trim(self):
+        if len(self.values) > self.size:
+            keep = np.argpartition(self.priorities, self.size)[:self.size]
+            self.values = self.values[keep]
+            self.priorities = self.priorities[keep]
+
+    def merge(self, other):
+        self.values = np.concatenate([self.values, other.values])
+        self.priorities = np.concatenate([self.priorities, other.priorities])
+        self._trim()
+
+    def quantile(self, q):
+        return np.quantile(self.values, q) if len(self.values) else np.nan
+
+class _Extremes:
+    """
+    The smallest and largest values of a column with their row numbers, used to find IQR outliers
+    once the quartiles of the whole column are known. Exact while there are fewer than size outliers on each side.
+    """
+    def __init__(self, values, rows, size=_EXTREMES_SIZE):
+        self.size = size
+        self.values = values
+        self.rows = rows
+        self._trim()
+
+    def _trim(self):
+        if len(self.values) > 2 * self.size:
+            order = np.argsort(self.values, kind='stable')
+            keep = np.concatenate([order[:self.size], order[-self.size:]])
+            self.values = self.values[keep]
+            self.rows = self.rows[keep]
+
+    def merge(self, other, offset):
+        self.values = np.concatenate([self.values, other.values])
+        self.rows = np.concatenate([self.rows, other.rows + offset])
+        self._trim()
+
+    def outliers(self, lower, upper):
+        outliers = pd.Series(self.values, index=self.rows)
+        return outliers[(outliers < lower) | (outliers > upper)].sort_index()
+
+class _ColumnStats:
+    """
+    Mergeable statistics of one column of one dataframe, holding the same information as _profile_column.
+    """
+    def __init__(self, series):
+        non_null = series.dropna()
+        self.numeric = pd.api.types.is_numeric_dtype(series)
+        self.count = len(non_null)
+        # Numbers are hashed as floats, so partitions read as int and as float hash the same values alike
+        hashed = non_null.astype('float64') if self.numeric else non_null
+        self.distinct = _DistinctSketch(pd.util.hash_pandas_object(hashed, index=False).values)
+
+        counts = non_null.value_counts()
+        if len(counts) > _FREQUENCY_CAPACITY:
+            threshold = counts.iloc[_FREQUENCY_CAPACITY]
+            counts = counts[counts > threshold] - threshold
+        self.top_values = _FrequencySketch(counts.to_dict())
+
+        if self.numeric:
+            values = non_null.to_numpy(dtype='float64')
+            self.sum = non_null.sum()
+            # Welford/Chan running mean and sum of squared deviations
+            self.mean = values.mean() if self.count else 0.0
+            self.m2 = ((values - self.mean)**2).sum()
+            self.quantiles = _QuantileSketch(values)
+            self.extremes = _Extremes(values, np.flatnonzero(series.notna().to_numpy()))
+
+    def merge(self, other, offset):
+        # An all-null chunk of a column may be read with another dtype than the rest, its statistics are empty anyway
+        if self.numeric != other.numeric:
+            if other.count == 0:
+                return
+            if self.count == 0:
+                self.__dict__.update(other.__dict__)
+                if self.numeric:
+                    self.extremes.rows = self.extremes.rows + offset
+                return
+            raise ValueError("A column holds numeric values in some rows and non-numeric values in others.")
+
+        if self.numeric:
+            count = self.count + other.count
+            if count:
+                delta = other.mean - self.mean
+                self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+                self.mean = self.mean + delta * other.count / count
+            self.sum = self.sum + other.sum
+            self.quantiles.merge(other.quantiles)
+            self.extremes.merge(other.extremes, offset)
+
+        self.count += other.count
+        self.distinct.merge(other.distinct)
+        self.top_values.merge(other.top_values)
+
+    def drift(self, other):
+        """
+        This function computes the drift metrics of the column from these statistics to other's, like _column_drift.
+        Numbers are binned on the quantile sample and other values on the top value counts, so the metrics
+        are exact while fewer than a few thousand values or distinct values were seen.
+        """
+        if self.numeric and other.numeric:
+            return _numeric_drift(self.quantiles.values, other.quantiles.values)
+        return _categorical_drift(self.top_values.counts, other.top_values.counts)
+
+    def profile(self):
+        """
+        This function returns the statistics in the format of _profile_column.
+        """
+        profile = {'non_null_rows': self.count, 'distinct_values': self.distinct.estimate(),
+                   'top_values': dict(self.top_values.top(5)),
+                   'median': None, 'mean': None, 'std': None, 'sum': None, 'outliers': None}
+
+        if self.numeric:
+            q1, median, q3 = (self.quantiles.quantile(q) for q in (0.25, 0.5, 0.75))
+            iqr = q3 - q1
+            profile.update({
+                'median': median,
+                'mean': self.mean if self.count else np.nan,
+                'std': np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan,
+                'sum': self.sum,
+                'outliers': self.extremes.outliers(q1 - 1.5 * iqr, q3 + 1.5 * iqr).to_json()})
+
+        return profile
+
+class PartialSummary:
+    """
+    Mergeable summary of the comparison of two dataframes, typically one partition of two larger datasets.
+    Summaries of consecutive partitions are combined in order with merge, and turned into the usual column
+    summary with to_col_summary. Counts, sums, means and standard deviations are exact; distinct counts, medians,
+    top values and outliers come from sketches that are exact up to a few thousand distinct values.
+    The difference mask of each column is stored in masks if given, to be shared with RowDiffs.
+    """
+    def __init__(self, df1, df2, new_cols_in_df1=(), new_cols_in_df2=(), masks=None):
+        self.rows = len(df1)
+        self.columns = list(df1.columns)
+        self.new_cols_in_df1 = set(new_cols_in_df1)
+        self.new_cols_in_df2 = set(new_cols_in_df2)
+
+        self.differences = {}
+        self.changes = {}
+        self.stats_df1 = {}
+        self.stats_df2 = {}
+        for col in self.columns:
+            mask = _difference_mask(df1[col], df2[col])
+            if masks is not None:
+                masks[col] = mask
+            self.differences[col] = mask.sum()
+            self.changes[col] = _FrequencySketch(_count_changes(df1, df2, col, mask).to_dict())
+            self.stats_df1[col] = _ColumnStats(df1[col])
+            self.stats_df2[col] = _ColumnStats(df2[col])
+
+    def merge(self, other):
+        """
+        Merges the summary of the rows following this summary's rows into this summary.
+        """
+        for col in other.columns:
+            if col not in self.columns:
+                self.columns.append(col)
+                self.differences[col] = other.differences[col]
+                self.changes[col] = other.changes[col]
+                self.stats_df1[col] = other.stats_df1[col]
+                self.stats_df2[col] = other.stats_df2[col]
+                # Row numbers of the outliers are relative to the other summary's rows, like in _ColumnStats.merge
+                for stats in (self.stats_df1[col], self.stats_df2[col]):
+                    if stats.numeric:
+                        stats.extremes.rows = stats.extremes.rows + self.rows
+                continue
+            self.differences[col] += other.differences[col]
+            self.changes[col].merge(other.changes[col])
+            self.stats_df1[col].merge(other.stats_df1[col], self.rows)
+            self.stats_df2[col].merge(other.stats_df2[col], self.rows)
+
+        self.rows += other.rows
+        self.new_cols_in_df1 |= other.new_cols_in_df1
+        self.new_cols_in_df2 |= other.new_cols_in_df2
+        return self
+
+    def to_col_summary(self):
+        """
+        Returns the column summary, in the same format as compare_datasets.
+        """
+        column_diffs = []
+        for col in self.columns:
+            col_diff = self.differences[col]
+            per_diff = col_diff / self.rows * 100 if self.rows else np.nan
+            changes_summary = pd.DataFrame([(change[0], change[1], count) for change, count in self.changes[col].top(5)],
+                                           columns=['from', 'to', 'count'])
+            profile1 = self.stats_df1[col].profile()
+            profile2 = self.stats_df2[col].profile()
+
+            column_diffs.append([col, col_diff, per_diff, _format_changes_summary(changes_summary)] +
+                                [stat for key in _PROFILE_STATS for stat in (profile1[key], profile2[key])] +
+                                list(self.stats_df1[col].drift(self.stats_df2[col])))
+
+        return _build_col_summary(column_diffs, self.columns, self.new_cols_in_df1, self.new_cols_in_df2)
+
+def _summarize_partition_files(path1, path2, row_diffs_path=None, format='parquet'):
+    """
+    This function compares one pair of partition files and returns its PartialSummary,
+    writing the row differences to row_diffs_path if given.
+    """
+    df1, df2 = _load_datasets(path1, path2)
+    df1, df2, new_cols_in_df1, new_cols_in_df2 = _ensure_same_shape(df1, df2)
+
+    masks = {}
+    summary = PartialSummary(df1, df2, new_cols_in_df1, new_cols_in_df2, masks)
+
+    if row_diffs_path is not None:
+        write_row_diffs(RowDiffs(df1, df2, masks).iter_batches(), row_diffs_path, format)
+
+    return summary
+
+def compare_partitioned(path1, path2, pattern='*.csv', max_workers=None, output_dir=None, format='parquet'):
+    """
+    Compares two partitioned datasets, given as directories of partition files, without loading them whole.
+    Partitions are matched by file name and compared in a pool of worker processes. Each worker returns a
+    PartialSummary and the partial summaries are merged, in file name order, into the column summary.
+
+    Parameters:
+    - path1, path2 (str): The directories holding the partitions of DF1 and DF2.
+    - pattern (str): Glob pattern selecting the partition files.
+    - max_workers (int): Number of worker processes, defaults to the number of CPUs. With 1, partitions are compared in this process.
+    - output_dir (str): If set, the row differences of each partition are written to output_dir/<partition>.<format>.
+    - format (str): 'parquet' or 'arrow', used with output_dir.
+
+    Returns the column summary, in the same format as compare_datasets.
+    """
+    files1 = {os.path.basename(path): path for path in glob.glob(os.path.join(path1, pattern))}
+    files2 = {os.path.basename(path): path for path in glob.glob(os.path.join(path2, pattern))}
+    if set(files1) != set(files2):
+        raise ValueError(f"The following partitions exist in only one of the datasets: {sorted(set(files1) ^ set(files2))}")
+    if not files1:
+        raise ValueError(f"No partitions matching '{pattern}' found in '{path1}'")
+
+    names = sorted(files1)
+    row_diffs_paths = [None] * len(names)
+    if output_dir is not None:
+        _check_output_format(format)
+        os.makedirs(output_dir, exist_ok=True)
+        row_diffs_paths = [os.path.join(output_dir, os.path.splitext(name)[0] + _OUTPUT_EXTENSIONS[format]) for name in names]
+
+    args = ([files1[name] for name in names], [files2[name] for name in names], row_diffs_paths, [format] * len(names))
+    if max_workers == 1:
+        partials = list(map(_summarize_partition_files, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            partials = list(executor.map(_summarize_partition_files, *args))
+
+    summary = partials[0]
+    for partial in partials[1:]:
+        summary.merge(partial)
+
+    return summary.to_col_summary()
+
+_INCREMENTAL_STATE_VERSION = 2
+# Number of bytes before the compared offset hashed to detect rewritten (not just appended) files
+_PREFIX_CHECK_SIZE = 4096
+
+def _read_prefix_check(path, offset):
+    """
+    This function hashes the bytes just before offset, to check on the next run that the file was only appended to.
+    """
+    with open(path, 'rb') as f:
+        f.seek(max(offset - _PREFIX_CHECK_SIZE, 0))
+        return hashlib.blake2b(f.read(min(offset, _PREFIX_CHECK_SIZE)), digest_size=20).hexdigest()
+
+def _read_appended_lines(path, offset):
+    """
+    This function reads the header line and the complete lines appended after offset (the end of the header on
+    the first run). Returns the header, the non-blank lines and the byte offset at the end of each of them.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(offset, len(header)))
+        data = f.read()
+
+    start = max(offset, len(header))
+    lines = []
+    ends = []
+    for line in data[:data.rfind(b'\n') + 1].splitlines(keepends=True):
+        start += len(line)
+        if line.strip():
+            lines.append(line)
+            ends.append(start)
+    return header, lines, ends
+
+def _parse_csv_lines(header, lines, first_row):
+    """
+    This function parses CSV lines like _read_csv, numbering the rows from first_row.
+    """
+    df = pd.read_csv(io.BytesIO(header + b''.join(lines)))
+    df.replace({'': pd.NA}, inplace=True)
+    df.index = pd.RangeIndex(first_row, first_row + len(df))
+    return df
+
+def compare_incremental(path1, path2, state_path):
+    """
+    Compares two append-only CSV files, only reading the rows appended since the previous run.
+    The byte offsets reached in both files and the mergeable PartialSummary of all rows compared so far are kept
+    in state_path. Each run compares the rows appended to both files (up to the shorter of the two), merges their
+    summary into the stored one and saves it. If a file was rewritten rather than appended to, or the state belongs
+    to other files, the comparison starts over from the first row. Records must not contain line breaks.
+
+    Parameters:
+    - path1, path2 (str): The CSV files of DF1 and DF2.
+    - state_path (str): The file holding the state between runs. It is created on the first run.
+
+    Returns the column summary of all rows compared so far, in the same format as compare_datasets, and the
+    row differences of the rows compared in this run, indexed by row number.
+    """
+    for path in (path1, path2):
+        if not os.path.exists(path):
+            raise ValueError(f"No file found at path '{path}'")
+
+    state = None
+    if os.path.exists(state_path):
+        with open(state_path, 'rb') as f:
+            state = pickle.load(f)
+        files = (os.path.abspath(path1), os.path.abspath(path2))
+        if state['version'] != _INCREMENTAL_STATE_VERSION or state['files'] != files:
+            logger.info(f"Incremental state in '{state_path}' is for other files, starting over")
+            state = None
+        elif any(os.path.getsize(path) < offset or _read_prefix_check(path, offset) != check
+                 for path, offset, check in zip((path1, path2), state['offsets'], state['checks'])):
+            logger.info(f"'{path1}' or '{path2}' was rewritten since the last comparison, starting over")
+            state = None
+
+    offsets = state['offsets'] if state is not None else (0, 0)
+    rows = state['summary'].rows if state is not None else 0
+
+    header1, lines1, ends1 = _read_appended_lines(path1, offsets[0])
+    header2, lines2, ends2 = _read_appended_lines(path2, offsets[1])
+    new_rows = min(len(lines1), len(lines2))
+
+    df1 = _parse_csv_lines(header1, lines1[:new_rows], rows)
+    df2 = _parse_csv_lines(header2, lines2[:new_rows], rows)
+
+    df1, df2, new_cols_in_df1, new_cols_in_df2 = _align_frames(df1, df2)
+
+    masks = {}
+    summary = PartialSummary(df1, df2, new_cols_in_df1, new_cols_in_df2, masks)
+    if state is not None:
+        summary = state['summary'].merge(summary)
+
+    if new_rows:
+        offsets = (ends1[new_rows - 1], ends2[new_rows - 1])
+    state = {'version': _INCREMENTAL_STATE_VERSION,
+             'files': (os.path.abspath(path1), os.path.abspath(path2)),
+             'offsets': offsets,
+             'checks': (_read_prefix_check(path1, offsets[0]), _read_prefix_check(path2, offsets[1])),
+             'summary': summary}
+
+    temp_path = f'{state_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(temp_path, state_path)
+
+    return summary.to_col_summary(), RowDiffs(df1, df2, masks).to_frame()
+
+def _hash_block(digests):
+    digest = hashlib.blake2b(digest_size=16)
+    for d in digests:
+        digest.update(d)
+    return digest.digest()
+
+def _build_block_tree(path, block_size):
+    """
+    This function streams a CSV file and hashes its rows in blocks of block_size rows, without parsing them.
+    Returns the header line, the number of rows, the byte offset where each block starts (plus the end of the
+    last one) and the levels of the hash tree, from the block hashes up to the root.
+    """
+    offsets = []
+    leaves = []
+    rows = 0
+    with open(path, 'rb') as f:
+        header = f.readline()
+        digest = None
+        position = f.tell()
+        for line in f:
+            # Line endings are ignored, so a missing final newline or CRLF endings don't make a block differ
+            content = line.rstrip(b'\r\n')
+            if content:
+                if rows % block_size == 0:
+                    if digest is not None:
+                        leaves.append(digest.digest())
+                    digest = hashlib.blake2b(digest_size=16)
+                    offsets.append(position)
+                digest.update(content + b'\n')
+                rows += 1
+            position += len(line)
+        if digest is not None:
+            leaves.append(digest.digest())
+        offsets.append(position)
+
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([_hash_block(level[i:i + 2]) for i in range(0, len(level), 2)])
+
+    return {'header': header, 'rows': rows, 'offsets': offsets, 'levels': levels}
+
+def _load_block_tree(path, block_size, cache_dir=None):
+    """
+    This function returns the block hash tree of a file, from cache_dir if it holds one for the same file,
+    size, modification time and block size.
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"No file found at path '{path}'")
+    if cache_dir is None:
+        return _build_block_tree(path, block_size)
+
+    stat = os.stat(path)
+    key = json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns, block_size])
+    tree_path = os.path.join(cache_dir, hashlib.blake2b(key.encode(), digest_size=20).hexdigest() + '.tree')
+    if os.path.exists(tree_path):
+        with open(tree_path, 'rb') as f:
+            return pickle.load(f)
+
+    tree = _build_block_tree(path, block_size)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f'{tree_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(tree, f)
+    os.replace(temp_path, tree_path)
+    return tree
+
+def _differing_blocks(tree1, tree2):
+    """
+    This function walks both hash trees from the root down, only into the nodes whose hashes differ,
+    and returns the indexes of the differing blocks.
+    """
+    levels1, levels2 = tree1['levels'], tree2['levels']
+    if tree1['header'].rstrip(b'\r\n') != tree2['header'].rstrip(b'\r\n'):
+        return list(range(len(levels1[0])))
+
+    nodes = [0] if levels1[0] else []
+    for level in range(len(levels1) - 1, -1, -1):
+        differing = [i for i in nodes if levels1[level][i] != levels2[level][i]]
+        if level == 0:
+            return differing
+        nodes = [child for i in differing for child in (2 * i, 2 * i + 1) if child < len(levels1[level - 1])]
+    return []
+
+def _read_block(path, tree, block, block_size):
+    """
+    This function reads and parses one block of rows of a CSV file, numbering the rows from the block's first row.
+    """
+    with open(path, 'rb') as f:
+        f.seek(tree['offsets'][block])
+        data = f.read(tree['offsets'][block + 1] - tree['offsets'][block])
+    return _parse_csv_lines(tree['header'], [data if data.endswith(b'\n') else data + b'\n'], block * block_size)
+
+def locate_differences(path1, path2, block_size=10000, tree_cache_dir=None):
+    """
+    Finds the row ranges where two ordered CSV files differ, without parsing them. Both files are streamed and
+    their rows hashed in blocks of block_size rows, the block hashes are combined into a hash tree and only the
+    branches whose hashes differ are followed down to the blocks.
+
+    Parameters:
+    - path1, path2 (str): The CSV files of DF1 and DF2.
+    - block_size (int): Number of rows per block.
+    - tree_cache_dir (str): If set, hash trees are cached there per file, size and modification time, so
+      comparing another file against the same baseline reuses the baseline's tree.
+
+    Returns the list of differing row ranges, as (first row, last row + 1) tuples.
+    """
+    tree1 = _load_block_tree(path1, block_size, tree_cache_dir)
+    tree2 = _load_block_tree(path2, block_size, tree_cache_dir)
+    if tree1['rows'] != tree2['rows']:
+        raise ValueError(f"The two dataframes have a different number of rows. DataFrame 1 has {tree1['rows']} rows while DataFrame 2 has {tree2['rows']} rows.")
+
+    return [(block * block_size, min((block + 1) * block_size, tree1['rows'])) for block in _differing_blocks(tree1, tree2)]
+
+def compare_blocks(path1, path2, block_size=10000, tree_cache_dir=None):
+    """
+    Compares two large, mostly identical ordered CSV files by only parsing the blocks of rows that differ,
+    located with locate_differences. The differing blocks go through the usual column and row comparison.
+
+    Returns a column summary with the number and percentage of differences (out of all rows), the top 5 changes
+    and the column presence, and the row differences of the differing blocks, indexed by row number.
+    Statistics of the individual datasets are not reported, since identical blocks are never parsed.
+    """
+    tree1 = _load_block_tree(path1, block_size, tree_cache_dir)
+    tree2 = _load_block_tree(path2, block_size, tree_cache_dir)
+    if tree1['rows'] != tree2['rows']:
+        raise ValueError(f"The two dataframes have a different number of rows. DataFrame 1 has {tree1['rows']} rows while DataFrame 2 has {tree2['rows']} rows.")
+
+    blocks = _differing_blocks(tree1, tree2)
+    header1 = pd.read_csv(io.BytesIO(tree1['header']), nrows=0).columns
+    header2 = pd.read_csv(io.BytesIO(tree2['header']), nrows=0).columns
+    df1 = pd.concat([_read_block(path1, tree1, block, block_size) for block in blocks] or [pd.DataFrame(columns=header1)])
+    df2 = pd.concat([_read_block(path2, tree2, block, block_size) for block in blocks] or [pd.DataFrame(columns=header2)])
+
+    df1, df2, new_cols_in_df1, new_cols_in_df2 = _align_frames(df1, df2)
+    columns = list(df1.columns)
+
+    column_diffs = []
+    masks = {}
+    for col in columns:
+        mask = masks[col] = _difference_mask(df1[col], df2[col])
+        col_diff = mask.sum()
+        per_diff = col_diff / tree1['rows'] * 100 if tree1['rows'] else np.nan
+        column_diffs.append([col, col_diff, per_diff, _calculate_changes_summary(df1, df2, col, mask)])
+
+    col_summary = pd.DataFrame(column_diffs, columns=_COL_SUMMARY_COLUMNS[:4])
+    col_summary['Column Presence'] = _check_column_presence(columns, new_cols_in_df1, new_cols_in_df2)
+
+    return col_summary, RowDiffs(df1, df2, masks).to_frame()
+
+_METADATA_PROFILE_VERSION = 1
+
+def _metadata_value(value):
+    """
+    This function turns a min/max value into a plain Python value that can be stored as JSON.
+    """
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat()
+    return value
+
+def _frame_metadata(df):
+    """
+    This function computes the metadata compared by compare_metadata from a dataframe: the number of rows
+    and, per column, the dtype, null count, minimum and maximum.
+    """
+    columns = {}
+    for col in df.columns:
+        non_null = df[col].dropna()
+        try:
+            minimum, maximum = (non_null.min(), non_null.max()) if len(non_null) else (None, None)
+        except TypeError:
+            # Mixed types have no order
+            minimum = maximum = None
+        columns[col] = {'dtype': str(df[col].dtype), 'null_count': int(len(df) - len(non_null)),
+                        'min': _metadata_value(minimum), 'max': _metadata_value(maximum)}
+    return {'rows': len(df), 'columns': columns}
+
+def _parquet_metadata(path):
+    """
+    This function reads the metadata compared by compare_metadata from a Parquet file's footer, using the row
+    group statistics for the null counts, minimums and maximums. Statistics missing from any row group are None.
+    """
+    pa, pq = _import_pyarrow()
+    metadata = pq.read_metadata(path)
+    schema = metadata.schema.to_arrow_schema()
+
+    columns = {}
+    for index in range(metadata.num_columns):
+        name = metadata.schema.column(index).path
+        try:
+            dtype = str(np.dtype(schema.field(name).type.to_pandas_dtype()))
+        except (KeyError, NotImplementedError, TypeError):
+            dtype = str(metadata.schema.column(index).physical_type).lower()
+
+        null_count, minimum, maximum = 0, None, None
+        for group in range(metadata.num_row_groups):
+            stats = metadata.row_group(group).column(index).statistics
+            if stats is None or not stats.has_null_count or null_count is None:
+                null_count = None
+            else:
+                null_count += stats.null_count
+            if stats is None or not stats.has_min_max:
+                if metadata.row_group(group).num_rows:
+                    minimum = maximum = pd.NA
+                continue
+            if minimum is not pd.NA:
+                minimum = stats.min if minimum is None else min(minimum, stats.min)
+                maximum = stats.max if maximum is None else max(maximum, stats.max)
+
+        columns[name] = {'dtype': dtype, 'null_count': null_count,
+                         'min': None if minimum is pd.NA else _metadata_value(minimum),
+                         'max': None if maximum is pd.NA else _metadata_value(maximum)}
+
+    return {'rows': metadata.num_rows, 'columns': columns}
+
+def _csv_metadata(path):
+    """
+    This function returns the metadata compared by compare_metadata for a CSV file from its sidecar profile,
+    <path>.profile.json. The profile is computed by reading the file, and persisted, when it is missing or
+    was made for another version of the file (by size and modification time). A profile that can't be
+    written is not persisted.
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"No file found at path '{path}'")
+    stat = os.stat(path)
+    profile_path = path + '.profile.json'
+    if os.path.isfile(profile_path):
+        with open(profile_path) as f:
+            profile = json.load(f)
+        if (profile.get('version'), profile.get('size'), profile.get('mtime_ns')) == (_METADATA_PROFILE_VERSION, stat.st_size, stat.st_mtime_ns):
+            return profile
+
+    profile = _frame_metadata(_read_csv(path))
+    profile.update({'version': _METADATA_PROFILE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    temp_path = f'{profile_path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(profile, f)
+        os.replace(temp_path, profile_path)
+    except OSError as e:
+        # The profile is only a shortcut for the next run, e.g. a read-only data directory just goes without it
+        logger.debug(f"Not persisting the metadata profile of '{path}': {e}")
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+    return profile
+
+def _dataset_metadata(df):
+    """
+    This function returns the metadata of a dataset given as a Parquet file, a CSV file or a dataframe.
+    """
+    if isinstance(df, pd.DataFrame):
+        return _frame_metadata(df)
+    if not isinstance(df, str):
+        raise ValueError("Input arguments must be paths to Parquet or CSV files or pandas.DataFrame instances.")
+    if os.path.splitext(df)[1].lower() in ('.parquet', '.pq'):
+        if not os.path.exists(df):
+            raise ValueError(f"No file found at path '{df}'")
+        return _parquet_metadata(df)
+    return _csv_metadata(df)
+
+# Columns of the summary returned by compare_metadata, named like their col_summary counterparts
+_METADATA_SUMMARY_COLUMNS = [
+    'Column',
+    'Rows DF1',
+    'Rows DF2',
+    'Dtype DF1',
+    'Dtype DF2',
+    'Non-null Rows DF1',
+    'Non-null Rows DF2',
+    'Null Count DF1',
+    'Null Count DF2',
+    'Min DF1',
+    'Min DF2',
+    'Max DF1',
+    'Max DF2']
+
+def compare_metadata(df1, df2):
+    """
+    Compares two datasets from their metadata only, as a quick check before a full comparison: row counts,
+    dtypes, null counts and minimums and maximums per column. Parquet files are not read, the metadata comes
+    from their footers and row group statistics. CSV files are profiled once into a sidecar <path>.profile.json
+    file, reused as long as the file doesn't change. Dataframes are profiled directly.
+
+    Returns a summary with one row per column, in the column order and with the Column Presence of
+    compare_datasets' column summary. Values that are not available are None.
+    """
+    metadata1 = _dataset_metadata(df1)
+    metadata2 = _dataset_metadata(df2)
+    columns1, columns2 = metadata1['columns'], metadata2['columns']
+
+    new_cols_in_df1 = [col for col in columns2 if col not in columns1]
+    new_cols_in_df2 = [col for col in columns1 if col not in columns2]
+    columns = list(columns2) + new_cols_in_df2
+
+    rows = []
+    for col in columns:
+        stats1 = columns1.get(col, {})
+        stats2 = columns2.get(col, {})
+        non_null = [metadata['rows'] - stats['null_count'] if stats.get('null_count') is not None else None
+                    for metadata, stats in ((metadata1, stats1), (metadata2, stats2))]
+        rows.append([col, metadata1['rows'], metadata2['rows'], stats1.get('dtype'), stats2.get('dtype')] + non_null +
+                    [stats1.get('null_count'), stats2.get('null_count'), stats1.get('min'), stats2.get('min'),
+                     stats1.get('max'), stats2.get('max')])
+
+    summary = pd.DataFrame(rows, columns=_METADATA_SUMMARY_COLUMNS)
+    summary['Column Presence'] = _check_column_presence(columns, new_cols_in_df1, new_cols_in_df2)
+    return summary
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+def _import_sqlalchemy():
+    """
+    This function imports SQLAlchemy, which is only needed for database sources.
+    """
+    try:
+        import sqlalchemy as sa
+    except ImportError:
+        raise ImportError("Database sources require SQLAlchemy. Install it with 'pip install sqlalchemy'.")
+    return sa
+
+def _get_engine(url):
+    """
+    This function returns a pooled SQLAlchemy engine for the given URL, creating it on first use.
+    Engines are shared by all comparisons in the process.
+    """
+    sa = _import_sqlalchemy()
+    with _ENGINES_LOCK:
+        if url not in _ENGINES:
+            _ENGINES[url] = sa.create_engine(url)
+        return _ENGINES[url]
+
+class SqlTable:
+    """
+    A database table used as an input dataset.
+
+    Parameters:
+    - url (str): A SQLAlchemy database URL, e.g. 'sqlite:///data.db' or 'postgresql://user@host/db'.
+    - table (str): The name of the table.
+    - order_by (str or list): Column(s) defining the row order, as rows are compared by position.
+      Without it rows are compared in the order the database returns them.
+    """
+    def __init__(self, url, table, order_by=None):
+        self.url = url
+        self.table = table
+        self.order_by = [order_by] if isinstance(order_by, str) else list(order_by or [])
+
+    def __repr__(self):
+        return f"SqlTable({self.url!r}, {self.table!r}, order_by={self.order_by!r})"
+
+    def reflect(self):
+        """
+        Returns the engine and the reflected SQLAlchemy table.
+        """
+        sa = _import_sqlalchemy()
+        engine = _get_engine(self.url)
+        return engine, sa.Table(self.table, sa.MetaData(), autoload_with=engine)
+
+    def select(self, table, columns=None):
+        """
+        Returns a select of the given columns (all by default) in the table's row order.
+        """
+        sa = _import_sqlalchemy()
+        columns = table.columns if columns is None else [table.c[col] for col in columns]
+        return sa.select(*columns).order_by(*[table.c[col] for col in self.order_by])
+
+def _read_sql_table(source):
+    """
+    This function reads a whole database table into a pandas DataFrame.
+    """
+    engine, table = source.reflect()
+    with engine.connect() as conn:
+        return pd.read_sql(source.select(table), conn)
+
+def _sql_is_numeric(column):
+    sa = _import_sqlalchemy()
+    return isinstance(column.type, (sa.Integer, sa.Numeric, sa.Float)) and not isinstance(column.type, sa.Boolean)
+
+def _sql_quantile(conn, column, non_null_rows, q):
+    """
+    This function calculates a quantile of a column inside the database with the same linear interpolation
+    as pandas, reading at most two rows.
+    """
+    sa = _import_sqlalchemy()
+    position = (non_null_rows - 1) * q
+    lower = int(np.floor(position))
+    values = conn.execute(sa.select(column).where(column.isnot(None)).order_by(column).limit(2).offset(lower)).scalars().all()
+    if len(values) == 1 or position == lower:
+        return float(values[0])
+    return float(values[0]) + (float(values[1]) - float(values[0])) * (position - lower)
+
+def _sql_profile(source):
+    """
+    This function profiles every column of a database table with aggregate queries run by the database:
+    one query for counts, distinct counts, sums and means, one for the standard deviations, and per column
+    one query for the top values and a few single-row queries for the median and the outliers.
+    Returns the number of rows and the profiles in the format of _profile_column.
+    """
+    sa = _import_sqlalchemy()
+    engine, table = source.reflect()
+    columns = list(table.columns)
+    numeric = [col for col in columns if _sql_is_numeric(col)]
+
+    with engine.connect() as conn:
+        aggregates = [sa.func.count().label('rows')]
+        for i, col in enumerate(columns):
+            aggregates += [sa.func.count(col).label(f'count_{i}'), sa.func.count(sa.distinct(col)).label(f'distinct_{i}')]
+            if col in numeric:
+                aggregates += [sa.func.sum(col).label(f'sum_{i}'), sa.func.avg(col).label(f'mean_{i}')]
+        stats = conn.execute(sa.select(*aggregates).select_from(table)).mappings().one()
+
+        # Deviations from the mean are summed in a second pass, which is more accurate than using AVG(x*x)
+        squares = {}
+        if numeric:
+            deviations = [sa.func.sum((col - stats[f'mean_{columns.index(col)}']) * (col - stats[f'mean_{columns.index(col)}'])).label(col.name)
+                          for col in numeric if stats[f'mean_{columns.index(col)}'] is not None]
+            if deviations:
+                squares = conn.execute(sa.select(*deviations).select_from(table)).mappings().one()
+
+        profiles = {}
+        for i, col in enumerate(columns):
+            count = stats[f'count_{i}']
+            top_values = conn.execute(sa.select(col, sa.func.count().label('count')).where(col.isnot(None)).group_by(col)
+                                      .order_by(sa.desc('count')).limit(5)).all()
+            profile = {'non_null_rows': count, 'distinct_values': stats[f'distinct_{i}'], 'top_values': dict(top_values),
+                       'median': None, 'mean': None, 'std': None, 'sum': None, 'outliers': None}
+
+            if col in numeric:
+                profile['sum'] = stats[f'sum_{i}'] if count else 0
+                profile['mean'] = float(stats[f'mean_{i}']) if count else np.nan
+                profile['std'] = float(np.sqrt(squares[col.name] / (count - 1))) if count > 1 else np.nan
+                profile['median'] = _sql_quantile(conn, col, count, 0.5) if count else np.nan
+
+                outliers = pd.Series(dtype='float64')
+                if count:
+                    q1 = _sql_quantile(conn, col, count, 0.25)
+                    q3 = _sql_quantile(conn, col, count, 0.75)
+                    iqr = q3 - q1
+                    row_number = (sa.func.row_number().over(order_by=[table.c[name] for name in source.order_by] or None) - 1).label('row')
+                    numbered = sa.select(row_number, col.label('value')).subquery()
+                    rows = conn.execute(sa.select(numbered.c.row, numbered.c.value)
+                                        .where((numbered.c.value < q1 - 1.5 * iqr) | (numbered.c.value > q3 + 1.5 * iqr))
+                                        .order_by(numbered.c.row)).all()
+                    outliers = pd.Series([value for _, value in rows], index=[row for row, _ in rows], dtype='float64')
+                profile['outliers'] = outliers.to_json()
+
+            profiles[col.name] = profile
+
+    return stats['rows'], profiles
+
+def _sql_histograms(source, columns, edges):
+    """
+    This function counts the non-null values of the given columns of a database table inside the database:
+    per bin for the columns with bin edges, as an array, and per value for the others, as a dict.
+    """
+    sa = _import_sqlalchemy()
+    engine, table = source.reflect()
+    histograms = {}
+    with engine.connect() as conn:
+        for name in columns:
+            if name not in table.c:
+                continue
+            col = table.c[name]
+            if name in edges:
+                # The bin of a value is the number of edges at or below it, like np.searchsorted(side='right')
+                bucket = sum((sa.case((col >= float(edge), 1), else_=0) for edge in edges[name]), sa.literal(0)).label('bucket')
+                counts = np.zeros(len(edges[name]) + 1)
+                for index, count in conn.execute(sa.select(bucket, sa.func.count()).where(col.isnot(None)).group_by(bucket)).all():
+                    counts[index] = count
+                histograms[name] = counts
+            else:
+                histograms[name] = dict(conn.execute(sa.select(col, sa.func.count()).where(col.isnot(None)).group_by(col)).all())
+    return histograms
+
+def _sql_drift(table1, table2, columns, profiles1):
+    """
+    This function computes the drift metrics of each column from table1 to table2 like _column_drift,
+    with the bins and counts computed by the database. Returns {column: (psi, ks, js)}.
+    """
+    engine1, t1 = table1.reflect()
+    _, t2 = table2.reflect()
+
+    edges = {}
+    with engine1.connect() as conn:
+        for name in columns:
+            if name in t1.c and name in t2.c and _sql_is_numeric(t1.c[name]) and _sql_is_numeric(t2.c[name]):
+                count = profiles1[name]['non_null_rows']
+                quantiles = [_sql_quantile(conn, t1.c[name], count, q) for q in np.linspace(0, 1, _DRIFT_BINS + 1)[1:-1]] if count else []
+                edges[name] = np.unique(quantiles)
+
+    histograms1 = _sql_histograms(table1, columns, edges)
+    histograms2 = _sql_histograms(table2, columns, edges)
+    drift = {}
+    for name in columns:
+        if name not in histograms1 or name not in histograms2:
+            drift[name] = (np.nan, np.nan, np.nan)
+        elif name in edges:
+            drift[name] = _distribution_drift(histograms1[name], histograms2[name], ordered=True)
+        else:
+            drift[name] = _categorical_drift(histograms1[name], histograms2[name])
+    return drift
+
+def _iter_sql_chunks(source, chunksize):
+    """
+    This function streams the rows of a database table in chunks through a pooled connection.
+    Results are streamed with a server-side cursor where the driver supports it, otherwise drivers like
+    psycopg2 or pymysql would buffer the whole result before returning the first chunk.
+    """
+    engine, table = source.reflect()
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        yield from pd.read_sql(source.select(table), conn, chunksize=chunksize)
+
+def _empty_profile():
+    return {'non_null_rows': 0, 'distinct_values': 0, 'top_values': {},
+            'median': None, 'mean': None, 'std': None, 'sum': None, 'outliers': None}
+
+def compare_sql_tables(table1, table2, chunksize=100000, row_diffs_path=None, format='parquet'):
+    """
+    Compares two database tables, pushing the column statistics down to the databases.
+    Counts, distinct counts, sums, means, standard deviations, medians, top values and outliers are computed
+    by the databases with aggregate queries. Only the differences are computed in pandas, on rows fetched
+    chunksize at a time from both tables through pooled connections, so a table is never fully loaded.
+
+    Parameters:
+    - table1, table2 (SqlTable): The tables to compare.
+    - chunksize (int): Number of rows fetched per batch.
+    - row_diffs_path (str): If set, the row differences are written there with write_row_diffs, batch by batch.
+    - format (str): 'parquet' or 'arrow', used with row_diffs_path.
+
+    Returns the column summary, in the same format as compare_datasets.
+    """
+    rows1, profiles1 = _sql_profile(table1)
+    rows2, profiles2 = _sql_profile(table2)
+    if rows1 != rows2:
+        raise ValueError(f"The two dataframes have a different number of rows. DataFrame 1 has {rows1} rows while DataFrame 2 has {rows2} rows.")
+
+    columns = list(profiles2) + [col for col in profiles1 if col not in profiles2]
+    new_cols_in_df1 = [col for col in profiles2 if col not in profiles1]
+    new_cols_in_df2 = [col for col in profiles1 if col not in profiles2]
+
+    differences = {col: 0 for col in columns}
+    changes = {col: _FrequencySketch({}) for col in columns}
+
+    def diff_chunks():
+        offset = 0
+        for chunk1, chunk2 in zip(_iter_sql_chunks(table1, chunksize), _iter_sql_chunks(table2, chunksize)):
+            chunk1 = _align_columns(chunk1, columns)
+            chunk2 = _align_columns(chunk2, columns)
+            chunk1.index = chunk2.index = pd.RangeIndex(offset, offset + len(chunk1))
+            offset += len(chunk1)
+
+            masks = {col: _difference_mask(chunk1[col], chunk2[col]) for col in columns}
+            for col in columns:
+                differences[col] += masks[col].sum()
+                changes[col].update(_count_changes(chunk1, chunk2, col, masks[col]).to_dict())
+
+            yield RowDiffs(chunk1, chunk2, masks).to_frame()
+
+    if row_diffs_path is not None:
+        write_row_diffs(diff_chunks(), row_diffs_path, format)
+    else:
+        for _ in diff_chunks():
+            pass
+
+    drift = _sql_drift(table1, table2, columns, profiles1)
+    column_diffs = []
+    for col in columns:
+        changes_summary = pd.DataFrame([(change[0], change[1], count) for change, count in changes[col].top(5)],
+                                       columns=['from', 'to', 'count'])
+        profile1 = profiles1.get(col, _empty_profile())
+        profile2 = profiles2.get(col, _empty_profile())
+        column_diffs.append([col, differences[col], differences[col] / rows1 * 100 if rows1 else np.nan,
+                             _format_changes_summary(changes_summary)] +
+                            [stat for key in _PROFILE_STATS for stat in (profile1[key], profile2[key])] + list(drift[col]))
+
+    return _build_col_summary(column_diffs, columns, new_cols_in_df1, new_cols_in_df2)
+
+# Schema name the second SQLite file is attached under by _sql_join_tables
+_SQL_ATTACHED_SCHEMA = 'datacompare_df2'
+
+def _sql_join_tables(conn, table1, table2):
+    """
+    This function reflects both tables on the given connection. If the second table lives in another
+    SQLite database file, that file is attached to the connection first, and must be detached by the caller.
+    """
+    sa = _import_sqlalchemy()
+    t1 = sa.Table(table1.table, sa.MetaData(), autoload_with=conn)
+    if table2.url == table1.url:
+        return t1, sa.Table(table2.table, sa.MetaData(), autoload_with=conn)
+
+    url1, url2 = sa.engine.make_url(table1.url), sa.engine.make_url(table2.url)
+    if url1.get_backend_name() != 'sqlite' or url2.get_backend_name() != 'sqlite':
+        raise ValueError("Both tables must be in the same database, or in SQLite files that can be attached to each other.")
+    conn.exec_driver_sql(f"ATTACH DATABASE ? AS {_SQL_ATTACHED_SCHEMA}", (url2.database,))
+    try:
+        return t1, sa.Table(table2.table, sa.MetaData(), schema=_SQL_ATTACHED_SCHEMA, autoload_with=conn)
+    except BaseException:
+        conn.exec_driver_sql(f"DETACH DATABASE {_SQL_ATTACHED_SCHEMA}")
+        raise
+
+def compare_sql_join(table1, table2, key, all_rows=False):
+    """
+    Compares two tables inside their database by joining them on key columns, for tables in the same
+    database (or in two SQLite files, which are attached to each other). Difference counts, top changes and
+    differing rows are computed with SQL, column statistics are pushed down as in compare_sql_tables,
+    and only the aggregates and the differing rows are transferred.
+
+    Parameters:
+    - table1, table2 (SqlTable): The tables to compare.
+    - key (str or list): The column(s) matching rows of both tables. Every key must exist in both tables.
+    - all_rows (bool): Return every row in row_diffs, instead of only the rows with differences.
+
+    Returns the column summary and the row differences, in the same format as compare_datasets,
+    with the key columns as the index of the row differences.
+    """
+    sa = _import_sqlalchemy()
+    keys = [key] if isinstance(key, str) else list(key)
+
+    rows1, profiles1 = _sql_profile(table1)
+    rows2, profiles2 = _sql_profile(table2)
+    if rows1 != rows2:
+        raise ValueError(f"The two dataframes have a different number of rows. DataFrame 1 has {rows1} rows while DataFrame 2 has {rows2} rows.")
+
+    columns = [col for col in profiles2 if col not in keys] + [col for col in profiles1 if col not in profiles2 and col not in keys]
+    new_cols_in_df1 = [col for col in profiles2 if col not in profiles1]
+    new_cols_in_df2 = [col for col in profiles1 if col not in profiles2]
+    drift = _sql_drift(table1, table2, columns, profiles1)
+
+    with _get_engine(table1.url).connect() as conn:
+        t1, t2 = _sql_join_tables(conn, table1, table2)
+        try:
+            joined = t1.join(t2, sa.and_(*[t1.c[k] == t2.c[k] for k in keys]))
+
+            # Columns missing from one table are compared against NULL, like the NaN columns added by _ensure_same_shape
+            values1 = {col: t1.c[col] if col in t1.c else sa.null() for col in columns}
+            values2 = {col: t2.c[col] if col in t2.c else sa.null() for col in columns}
+            # Two NULLs compare as equal and a NULL and a value as different, like in compare_datasets
+            differs = {col: sa.case((values1[col] == values2[col], 0), (sa.and_(values1[col].is_(None), values2[col].is_(None)), 0), else_=1)
+                       for col in columns}
+
+            counts = conn.execute(sa.select(sa.func.count().label('rows'), *[sa.func.sum(differs[col]).label(f'diff_{i}') for i, col in enumerate(columns)])
+                                  .select_from(joined)).mappings().one()
+            if counts['rows'] != rows1:
+                raise ValueError(f"{rows1 - counts['rows']} rows of DataFrame 1 have no matching key in DataFrame 2.")
+
+            column_diffs = []
+            for i, col in enumerate(columns):
+                top_changes = conn.execute(sa.select(values1[col].label('from'), values2[col].label('to'), sa.func.count().label('count'))
+                                           .select_from(joined).where(differs[col] == 1).group_by(values1[col], values2[col])
+                                           .order_by(sa.desc('count')).limit(5)).all()
+                changes_summary = pd.DataFrame([tuple(change) for change in top_changes], columns=['from', 'to', 'count'], dtype=object)
+                col_diff = counts[f'diff_{i}'] or 0
+
+                profile1 = profiles1.get(col, _empty_profile())
+                profile2 = profiles2.get(col, _empty_profile())
+                column_diffs.append([col, col_diff, col_diff / rows1 * 100 if rows1 else np.nan, _format_changes_summary(changes_summary)] +
+                                    [stat for key in _PROFILE_STATS for stat in (profile1[key], profile2[key])] + list(drift[col]))
+
+            selected = [t1.c[k].label(k) for k in keys]
+            selected.append(sa.case((sa.and_(*[differs[col] == 0 for col in columns]), 1), else_=0).label('All_isequal'))
+            for col in columns:
+                selected += [values1[col].label(col+'_df1'), values2[col].label(col+'_df2'), (1 - differs[col]).label(col+'_isequal')]
+            query = sa.select(*selected).select_from(joined).order_by(*[t1.c[k] for k in keys])
+            if not all_rows:
+                query = query.where(sa.or_(*[differs[col] == 1 for col in columns]))
+            row_diffs = pd.read_sql(query, conn, index_col=keys)
+        finally:
+            # The attached file stays attached to the pooled connection otherwise, and the next join fails
+            if t2.schema == _SQL_ATTACHED_SCHEMA:
+                conn.exec_driver_sql(f"DETACH DATABASE {_SQL_ATTACHED_SCHEMA}")
+
+    equality_columns = ['All_isequal'] + [col+'_isequal' for col in columns]
+    row_diffs[equality_columns] = row_diffs[equality_columns].astype(bool)
+
+    return _build_col_summary(column_diffs, columns, new_cols_in_df1, new_cols_in_df2), row_diffs
+
+# Metrics kept by ProfileStore for each column of each run, and the col_summary columns they come from
+_PROFILE_STORE_METRICS = {
+    'mean_df1': 'Mean DF1',
+    'mean_df2': 'Mean DF2',
+    'distinct_df1': 'Distinct Values DF1',
+    'distinct_df2': 'Distinct Values DF2',
+    'null_rate_df1': 'Non-null Rows DF1',
+    'null_rate_df2': 'Non-null Rows DF2',
+    'difference_rate': 'Percentage of Differences'}
+
+class ProfileStore:
+    """
+    A local SQLite store of column profiles, to follow how datasets drift across repeated comparisons.
+    Each recorded run appends one row per column with the means, distinct counts and null rates of both datasets
+    and the difference rate. Queries use an index on (dataset, column, run time), so they never re-read old datasets.
+
+    Parameters:
+    - path (str): The SQLite database file, created if needed.
+    """
+    def __init__(self, path):
+        self.path = path
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            metrics = ', '.join(f'{metric} REAL' for metric in _PROFILE_STORE_METRICS)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS profiles (dataset TEXT NOT NULL, run_time TEXT NOT NULL, "
+                         f"column_name TEXT NOT NULL, {metrics})")
+            conn.execute("CREATE INDEX IF NOT EXISTS profiles_dataset_column_time ON profiles (dataset, column_name, run_time)")
+
+    def record(self, col_summary, rows, dataset='default', run_time=None):
+        """
+        Appends the profile of every column of a comparison to the store.
+
+        Parameters:
+        - col_summary (pd.DataFrame): The comparison summary dataframe, as output by compare_datasets
+        - rows (int): The number of rows compared, used for the null rates
+        - dataset (str): The name the runs of this comparison are recorded under
+        - run_time (datetime): The time of the run, now by default
+        """
+        run_time = _format_run_time(run_time or datetime.now(timezone.utc))
+
+        records = []
+        for _, column in col_summary.iterrows():
+            values = []
+            for metric, source in _PROFILE_STORE_METRICS.items():
+                value = column[source]
+                if metric.startswith('null_rate'):
+                    value = 1 - value / rows if rows else None
+                elif metric == 'difference_rate':
+                    value = value / 100
+                values.append(None if value is None or pd.isna(value) else float(value))
+            records.append([dataset, run_time, str(column['Column'])] + values)
+
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            placeholders = ', '.join('?' * (3 + len(_PROFILE_STORE_METRICS)))
+            conn.executemany(f"INSERT INTO profiles (dataset, run_time, column_name, {', '.join(_PROFILE_STORE_METRICS)}) "
+                             f"VALUES ({placeholders})", records)
+
+    def history(self, dataset='default', column=None, days=None, until=None):
+        """
+        Returns the recorded profiles of a dataset, optionally for one column and the last days before until (now by default).
+        """
+        query = f"SELECT run_time, column_name, {', '.join(_PROFILE_STORE_METRICS)} FROM profiles WHERE dataset = ?"
+        params = [dataset]
+        if column is not None:
+            query += " AND column_name = ?"
+            params.append(column)
+        if days is not None:
+            query += " AND run_time >= ?"
+            params.append(_format_run_time((until or datetime.now(timezone.utc)) - timedelta(days=days)))
+        query += " ORDER BY column_name, run_time"
+
+        with closing(sqlite3.connect(self.path)) as conn:
+            history = pd.read_sql_query(query, conn, params=params)
+        history['run_time'] = pd.to_datetime(history['run_time'])
+        return history.rename(columns={'column_name': 'column'})
+
+    def drifted_columns(self, metric, threshold, dataset='default', days=30, until=None):
+        """
+        Returns the columns whose metric changed by more than threshold (a fraction, e.g. 0.1 for 10%) between
+        the first and the last run of the last days before until (now by default).
+
+        Parameters:
+        - metric (str): One of 'mean_df1', 'mean_df2', 'distinct_df1', 'distinct_df2', 'null_rate_df1',
+          'null_rate_df2' and 'difference_rate'
+        - threshold (float): The minimum relative change reported
+        - dataset (str): The name the runs were recorded under
+        - days (int): The length of the window
+        """
+        if metric not in _PROFILE_STORE_METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Expected one of {list(_PROFILE_STORE_METRICS)}.")
+
+        since = _format_run_time((until or datetime.now(timezone.utc)) - timedelta(days=days))
+        query = f"""
+            SELECT DISTINCT column_name,
+                FIRST_VALUE(run_time) OVER runs AS first_run,
+                LAST_VALUE(run_time) OVER runs AS last_run,
+                FIRST_VALUE({metric}) OVER runs AS first_value,
+                LAST_VALUE({metric}) OVER runs AS last_value
+            FROM profiles
+            WHERE dataset = ? AND run_time >= ? AND {metric} IS NOT NULL
+            WINDOW runs AS (PARTITION BY column_name ORDER BY run_time ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)"""
+
+        with closing(sqlite3.connect(self.path)) as conn:
+            drift = pd.read_sql_query(query, conn, params=[dataset, since])
+
+        drift['change'] = (drift['last_value'] - drift['first_value']) / drift['first_value'].abs()
+        # A change from zero is infinite unless the value stayed at zero
+        drift.loc[(drift['first_value'] == 0) & (drift['last_value'] == 0), 'change'] = 0.0
+        drift = drift[drift['change'].abs() > threshold].sort_values(by='change', key=abs, ascending=False)
+        return drift.rename(columns={'column_name': 'column'}).reset_index(drop=True)
+
+def _format_run_time(run_time):
+    """
+    This function formats a run time as UTC ISO text, which SQLite compares in chronological order.
+    """
+    if run_time.tzinfo is not None:
+        run_time = run_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return run_time.isoformat(sep=' ', timespec='seconds')
+
+# Rows of df2 scored at once by detect_anomalies, between progress updates and cancellation checks
+_ANOMALY_SCORE_CHUNK_ROWS = 100000
+
+class _VectorizedDetector:
+    """
+    Base of the cheap anomaly detectors offered by detect_anomalies next to IsolationForest, with the same
+    fit/predict interface. Subclasses fit per-column parameters on DF1 and score rows with vectorized NumPy,
+    higher scores being more anomalous. Rows scoring above the (1 - contamination) quantile of DF1's scores
+    are predicted as anomalies (-1), the others as normal (1).
+    """
+    def __init__(self, contamination):
+        self.contamination = contamination
+
+    def fit(self, df):
+        values = df.to_numpy(dtype=np.float64)
+        self._fit(values)
+        scores = self.score(values)
+        self.threshold_ = np.quantile(scores, 1 - self.contamination) if len(scores) else np.inf
+        return self
+
+    def predict(self, df):
+        return np.where(self.score(df.to_numpy(dtype=np.float64)) > self.threshold_, -1, 1)
+
+class _RobustZScoreDetector(_VectorizedDetector):
+    """
+    Scores a row by its largest robust z-score, the distance to the column median in scaled MADs.
+    """
+    def _fit(self, values):
+        self.median_ = np.median(values, axis=0)
+        # 1.4826 scales the MAD to the standard deviation of normally distributed data
+        self.scale_ = 1.4826 * np.median(np.abs(values - self.median_), axis=0)
+
+    def score(self, values):
+        deviations = np.abs(values - self.median_)
+        # Columns with a zero MAD flag any value away from the median
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(self.scale_ > 0, deviations / self.scale_, np.where(deviations > 0, np.inf, 0.0))
+        return scores.max(axis=1, initial=0.0)
+
+class _IqrDetector(_VectorizedDetector):
+    """
+    Scores a row by how far its values fall outside the columns' 1.5 IQR fences, in IQRs.
+    Rows within all fences score 0 and are never anomalies.
+    """
+    def _fit(self, values):
+        q1, q3 = np.quantile(values, [0.25, 0.75], axis=0) if len(values) else (np.zeros(values.shape[1]),) * 2
+        self.iqr_ = q3 - q1
+        self.lower_ = q1 - 1.5 * self.iqr_
+        self.upper_ = q3 + 1.5 * self.iqr_
+
+    def score(self, values):
+        excess = np.maximum(self.lower_ - values, values - self.upper_).clip(min=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.where(self.iqr_ > 0, excess / self.iqr_, np.where(excess > 0, np.inf, 0.0))
+        return scores.max(axis=1, initial=0.0)
+
+    def fit(self, df):
+        super().fit(df)
+        self.threshold_ = max(self.threshold_, 0.0)
+        return self
+
+class _HbosDetector(_VectorizedDetector):
+    """
+    Histogram-based outlier score: the sum over columns of the negative log of the (max-normalized) height of
+    the DF1 histogram bin the value falls in. Values in empty bins or outside DF1's range get the lowest height.
+    """
+    _MIN_HEIGHT = 1e-6
+    _MAX_BINS = 100
+
+    def _fit(self, values):
+        bins = min(max(int(np.sqrt(len(values))), 1), self._MAX_BINS)
+        self.edges_ = []
+        self.log_heights_ = []
+        for column in values.T:
+            counts, edges = np.histogram(column, bins=bins)
+            heights = np.maximum(counts / max(counts.max(initial=0), 1), self._MIN_HEIGHT)
+            self.edges_.append(edges)
+            self.log_heights_.append(-np.log(heights))
+
+    def score(self, values):
+        scores = np.zeros(len(values))
+        outside = -np.log(self._MIN_HEIGHT)
+        for column, edges, log_heights in zip(values.T, self.edges_, self.log_heights_):
+            bins = np.searchsorted(edges, column, side='right') - 1
+            # The last bin includes its right edge, like np.histogram
+            bins[column == edges[-1]] = len(log_heights) - 1
+            inside = (bins >= 0) & (bins < len(log_heights))
+            scores += np.where(inside, log_heights[np.clip(bins, 0, len(log_heights) - 1)], outside)
+        return scores
+
+_ANOMALY_DETECTORS = {
+    'zscore': _RobustZScoreDetector,
+    'iqr': _IqrDetector,
+    'hbos': _HbosDetector,
+}
+
+def detect_anomalies(df1, df2, column_list=None, contamination=0.005, method='isolation_forest', progress=None, cancel=None):
+    """
+    This function fits an anomaly detector on the numeric columns of df1 (or column_list) and returns the rows
+    of df2 it flags, with an 'anomaly' column set to -1. The method is 'isolation_forest' (the default), or one
+    of the cheaper vectorized detectors: 'zscore' (robust z-score from the median and MAD), 'hbos'
+    (histogram-based outlier score) or 'iqr' (distance outside the 1.5 IQR fences). The vectorized detectors
+    flag the rows of df2 scoring above the (1 - contamination) quantile of df1's scores.
+    """
+    if method != 'isolation_forest' and method not in _ANOMALY_DETECTORS:
+        raise ValueError(f"Unsupported anomaly detection method '{method}'. Expected one of {['isolation_forest'] + list(_ANOMALY_DETECTORS)}.")
+
+    load_progress = _Progress(progress, cancel, 'load', 0)
+    df1, df2 = _load_datasets(df1, df2)
+    load_progress.rows_total = len(df1) + len(df2)
+    load_progress.update(rows_done=load_progress.rows_total)
 
     columns = []
 
@@ -231,25 +2654,283 @@ def detect_anomalies(df1, df2, column_list=None, contamination=0.005):
         if df1[column].dtype not in ['int64', 'float64'] or df2[column].dtype not in ['int64', 'float64']:
             raise ValueError(f"Column '{column}' is not numeric in one or both dataframes.")
 
+    # Selecting the columns copies only them, so the original dataframes are never modified
     df1 = df1[columns]
     df2 = df2[columns]
 
     # Handle missing values
-    df1.dropna(inplace=True)
-    df2.dropna(inplace=True)
+    df1 = df1.dropna()
+    df2 = df2.dropna()
 
     # Initialize the Model
-    iso = IsolationForest(contamination=contamination)
+    if method == 'isolation_forest':
+        iso = IsolationForest(contamination=contamination)
+    else:
+        iso = _ANOMALY_DETECTORS[method](contamination)
 
-    # Fit and Predict
+    # Fit and Predict, scoring df2 in chunks so progress is reported and cancellation is checked between them
+    fit_progress = _Progress(progress, cancel, 'fit', len(df1))
     iso.fit(df1)
-    df2['anomaly'] = iso.predict(df2)
+    fit_progress.update(rows_done=len(df1))
+
+    score_progress = _Progress(progress, cancel, 'score', len(df2))
+    predictions = []
+    for start in range(0, len(df2), _ANOMALY_SCORE_CHUNK_ROWS):
+        predictions.append(iso.predict(df2.iloc[start:start + _ANOMALY_SCORE_CHUNK_ROWS]))
+        score_progress.update(rows_done=start + len(predictions[-1]))
+    df2['anomaly'] = np.concatenate(predictions) if predictions else np.array([], dtype=int)
 
     # Filter and return only the anomalies from df2
     anomalies = df2[df2['anomaly'] == -1]
 
     return anomalies
 
+def _detect_group_anomalies(df1, df2, contamination, method):
+    """
+    This function detects the anomalies of one column group, in a worker process of detect_anomalies_by_group.
+    """
+    return detect_anomalies(df1, df2, list(df1.columns), contamination, method=method)
+
+def detect_anomalies_by_group(df1, df2, column_groups, contamination=0.005, method='isolation_forest', max_workers=None):
+    """
+    Runs detect_anomalies for several groups of columns against the same pair of datasets, which are loaded once.
+    A model is fitted on each group's columns of df1 and scores df2, in a pool of worker processes that only
+    receive their group's columns.
+
+    Parameters:
+    - df1, df2 (pd.DataFrame or str): The datasets, as for detect_anomalies.
+    - column_groups (dict or list): The column lists to fit a model on, by group name; a list of column lists
+      is named by position.
+    - contamination (float), method (str): As for detect_anomalies, used for every group.
+    - max_workers (int): Number of worker processes, defaults to the number of CPUs. With 1, groups are processed in this process.
+
+    Returns the anomalies of each group by group name, in the format of detect_anomalies, and the sorted
+    index of the df2 rows flagged by any group.
+    """
+    if not isinstance(column_groups, dict):
+        column_groups = dict(enumerate(column_groups))
+
+    df1, df2 = _load_datasets(df1, df2)
+    for columns in column_groups.values():
+        for column in columns:
+            if column not in df1.columns or column not in df2.columns:
+                raise ValueError(f"Column '{column}' not found in one or both dataframes.")
+
+    names = list(column_groups)
+    args = ([df1[list(column_groups[name])] for name in names], [df2[list(column_groups[name])] for name in names],
+            [contamination] * len(names), [method] * len(names))
+    if max_workers == 1:
+        results = list(map(_detect_group_anomalies, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_detect_group_anomalies, *args))
+
+    anomalies = dict(zip(names, results))
+    flagged = df2.index[:0]
+    for result in results:
+        flagged = flagged.union(result.index)
+
+    return anomalies, flagged
+
+_OUTPUT_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+def _import_pyarrow():
+    """
+    This function imports pyarrow, which is only needed by the Parquet/Arrow writers.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Writing Parquet/Arrow output requires pyarrow. Install it with 'pip install pyarrow'.")
+    return pa, pq
+
+def _to_arrow_table(pa, df, schema=None):
+    """
+    This function converts a dataframe to an Arrow table. Nested values (like the 'Top 5 values' dicts)
+    and object columns with mixed types are stored as strings, the same way to_csv would render them.
+    """
+    arrays = []
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            values = values.map(lambda v: str(v) if isinstance(v, (dict, list, tuple)) else v)
+            try:
+                array = pa.array(values, from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                array = pa.array(values.map(lambda v: None if pd.isna(v) else str(v)), type=pa.string())
+            # An all-null object column would be typed null, which the values of later batches can't be cast to
+            if pa.types.is_null(array.type):
+                array = array.cast(pa.string())
+        else:
+            array = pa.array(values, from_pandas=True)
+        arrays.append(array)
+
+    table = pa.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+    if schema is not None:
+        table = table.cast(schema)
+    return table
+
+def _open_table_writer(pa, pq, path, schema, format, compression):
+    """
+    This function opens an incremental Parquet or Arrow IPC writer for the given schema.
+    """
+    if format == 'parquet':
+        return pq.ParquetWriter(path, schema, compression=compression)
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    return pa.ipc.new_file(path, schema, options=options)
+
+def _check_output_format(format):
+    if format not in _OUTPUT_EXTENSIONS:
+        raise ValueError(f"Unsupported output format '{format}'. Expected one of {list(_OUTPUT_EXTENSIONS)}.")
+
+def _iter_batches(row_diffs, batch_size):
+    """
+    This function yields row_diffs in batches. A dataframe is sliced into batches of batch_size rows,
+    any other iterable is assumed to already produce dataframe batches.
+    """
+    if isinstance(row_diffs, pd.DataFrame):
+        for start in range(0, max(len(row_diffs), 1), batch_size):
+            yield row_diffs.iloc[start:start + batch_size]
+    else:
+        yield from row_diffs
+
+def _split_row_diffs_by_column(batch):
+    """
+    This function splits a row_diffs batch into one long frame per compared column,
+    holding the row number, both values and the equality flag.
+    """
+    for name in batch.columns:
+        if name == 'All_isequal' or not name.endswith('_isequal'):
+            continue
+        col = name[:-len('_isequal')]
+        yield col, pd.DataFrame({
+            'row': batch.index,
+            'df1': batch[col+'_df1'].values,
+            'df2': batch[col+'_df2'].values,
+            'isequal': batch[name].values})
+
+def _temp_output_path(path):
+    """
+    This function returns the temporary name an output file is written under before being renamed to path.
+    """
+    return f'{path}.{os.getpid()}.tmp'
+
+def _remove_if_exists(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def write_col_summary(col_summary, path, format='parquet', compression='zstd'):
+    """
+    Writes the column summary as a compressed Parquet or Arrow IPC file.
+
+    Parameters:
+    - col_summary (pd.DataFrame): The comparison summary dataframe, as output by compare_datasets
+    - path (str): The output file path
+    - format (str): 'parquet' or 'arrow'
+    - compression (str): The compression codec, e.g. 'zstd', 'lz4' or None
+    """
+    _check_output_format(format)
+    pa, pq = _import_pyarrow()
+
+    table = _to_arrow_table(pa, col_summary)
+    temp_path = _temp_output_path(path)
+    try:
+        writer = _open_table_writer(pa, pq, temp_path, table.schema, format, compression)
+        try:
+            writer.write_table(table)
+        finally:
+            writer.close()
+        os.replace(temp_path, path)
+    except BaseException:
+        _remove_if_exists(temp_path)
+        raise
+
+    return path
+
+def write_row_diffs(row_diffs, path, format='parquet', compression='zstd', partition_by_column=False, batch_size=100000):
+    """
+    Writes row differences as compressed Parquet or Arrow IPC, one batch at a time.
+
+    Parameters:
+    - row_diffs (pd.DataFrame or iterable of pd.DataFrame): The row differences, as output by compare_datasets.
+      When an iterable of batches is given, each batch is written as soon as it is produced.
+    - path (str): The output file path, or the output directory when partition_by_column is set
+    - format (str): 'parquet' or 'arrow'
+    - compression (str): The compression codec, e.g. 'zstd', 'lz4' or None
+    - partition_by_column (bool): Write one file per compared column under path/column=<name>/,
+      each holding the row number, the DF1 and DF2 values and the equality flag
+    - batch_size (int): Number of rows per batch when row_diffs is a dataframe
+    """
+    _check_output_format(format)
+    pa, pq = _import_pyarrow()
+
+    writers = {}
+    schemas = {}
+    # Files are written under temporary names and only renamed once every batch was written,
+    # so a failed or cancelled run doesn't leave partial outputs behind
+    targets = {}
+    created_dirs = [path] if partition_by_column and not os.path.isdir(path) else []
+
+    def write(key, target, frame):
+        if key not in writers:
+            table = _to_arrow_table(pa, frame)
+            schemas[key] = table.schema
+            targets[key] = target
+            writers[key] = _open_table_writer(pa, pq, _temp_output_path(target), table.schema, format, compression)
+        else:
+            table = _to_arrow_table(pa, frame, schemas[key])
+        writers[key].write_table(table)
+
+    try:
+        try:
+            for batch in _iter_batches(row_diffs, batch_size):
+                if not partition_by_column:
+                    write(None, path, batch)
+                    continue
+                for col, frame in _split_row_diffs_by_column(batch):
+                    col_dir = os.path.join(path, f'column={col}')
+                    if not os.path.isdir(col_dir):
+                        os.makedirs(col_dir)
+                        created_dirs.append(col_dir)
+                    write(col, os.path.join(col_dir, 'part-0' + _OUTPUT_EXTENSIONS[format]), frame)
+        finally:
+            for writer in writers.values():
+                writer.close()
+    except BaseException:
+        for target in targets.values():
+            _remove_if_exists(_temp_output_path(target))
+        for col_dir in reversed(created_dirs):
+            if os.path.isdir(col_dir) and not os.listdir(col_dir):
+                os.rmdir(col_dir)
+        raise
+
+    for target in targets.values():
+        os.replace(_temp_output_path(target), target)
+
+    return path
+
+def write_results(col_summary, row_diffs, output_dir, format='parquet', compression='zstd', partition_by_column=False, batch_size=100000):
+    """
+    Writes the outputs of compare_datasets to output_dir as 'column_summary' and 'row_differences'
+    Parquet or Arrow IPC files. See write_row_diffs for the meaning of the parameters.
+    Returns the paths of the column summary and row differences outputs.
+    """
+    _check_output_format(format)
+    os.makedirs(output_dir, exist_ok=True)
+
+    extension = _OUTPUT_EXTENSIONS[format]
+    summary_path = write_col_summary(col_summary, os.path.join(output_dir, 'column_summary' + extension), format, compression)
+
+    if partition_by_column:
+        row_diffs_path = os.path.join(output_dir, 'row_differences')
+    else:
+        row_diffs_path = os.path.join(output_dir, 'row_differences' + extension)
+    write_row_diffs(row_diffs, row_diffs_path, format, compression, partition_by_column, batch_size)
+
+    return summary_path, row_diffs_path
+
 def assert_dataframe_equal(df1, df2):
     pd.testing.assert_frame_equal(df1, df2)
 
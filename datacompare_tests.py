@@ -1,9 +1,28 @@
 import unittest
+import numpy as np
 import pandas as pd
+import importlib.util
 import json
 import os
+import tempfile
 import datacompare as dc
 
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    import sqlalchemy
+except ImportError:
+    sqlalchemy = None
+
+try:
+    import pyspark
+    from pyspark.sql import SparkSession
+except ImportError:
+    pyspark = None
+
 class DataFrameCompareTests(unittest.TestCase):
 
     def setUp(self):
@@ -17,15 +36,37 @@ class DataFrameCompareTests(unittest.TestCase):
     def tearDown(self):
         os.remove(self.test_file_path1)
         os.remove(self.test_file_path2)
+        if os.path.exists(self.test_file_path1 + '.profile.json'):
+            os.remove(self.test_file_path1 + '.profile.json')
 
     def test_ensure_same_shape(self):
          df1, df2, _, _ = dc._ensure_same_shape(self.df1, self.df2)
          self.assertEqual(df1.shape, df2.shape)
 
+    def test_ensure_same_shape_does_not_modify_inputs(self):
+        df1 = pd.DataFrame({'B': [4.0, 5.0, 6.0], 'A': ['x', 'y', 'z'], 'C': ['u', 'v', 'w']})
+        df2 = pd.DataFrame({'A': ['x', 'y', 'q'], 'B': [4.0, 0.0, 6.0], 'D': ['a', 'b', 'c']})
+        aligned1, aligned2, new_cols_in_df1, new_cols_in_df2 = dc._ensure_same_shape(df1, df2)
+
+        self.assertEqual(list(df1.columns), ['B', 'A', 'C'])
+        self.assertEqual(list(df2.columns), ['A', 'B', 'D'])
+        self.assertEqual(list(aligned1.columns), ['A', 'B', 'D', 'C'])
+        self.assertEqual(list(aligned2.columns), ['A', 'B', 'D', 'C'])
+        self.assertEqual((new_cols_in_df1, new_cols_in_df2), (['D'], ['C']))
+        self.assertTrue(np.shares_memory(aligned1['B'].values, df1['B'].values))
+
     def test_read_csv(self):
         df1 = dc._read_csv(self.test_file_path1)
         self.assertTrue(df1.equals(self.df1))
 
+    def test_load_datasets(self):
+        df1, df2 = dc._load_datasets(self.test_file_path1, self.test_file_path2)
+        self.assertTrue(df1.equals(self.df1))
+        self.assertTrue(df2.equals(self.df2))
+
+        with self.assertRaises(ValueError):
+            dc._load_datasets(self.test_file_path1, 'missing.csv')
+
     def test_check_column_presence(self):
         cols = dc._check_column_presence(self.df1.columns, [], [])
         self.assertIsInstance(cols, list)
@@ -45,6 +86,386 @@ class DataFrameCompareTests(unittest.TestCase):
         anomalies = dc.detect_anomalies(self.test_file_path1, self.test_file_path2)
         self.assertIsInstance(anomalies, pd.DataFrame)
 
+    def test_detect_anomalies_vectorized(self):
+        df1 = pd.DataFrame({'A': np.arange(100.0), 'B': np.arange(100.0) % 10})
+        df2 = df1.copy()
+        df2.loc[[3, 7], 'A'] = 1000.0
+        for method in ('zscore', 'hbos', 'iqr'):
+            anomalies = dc.detect_anomalies(df1, df2, contamination=0.01, method=method)
+            self.assertEqual(anomalies.index.tolist(), [3, 7], method)
+            self.assertTrue((anomalies['anomaly'] == -1).all())
+
+        # The method follows contamination, as documented and as in detect_anomalies_by_group
+        pd.testing.assert_frame_equal(dc.detect_anomalies(df1, df2, None, 0.01, 'zscore'),
+                                      dc.detect_anomalies(df1, df2, contamination=0.01, method='zscore'))
+
+        with self.assertRaises(ValueError):
+            dc.detect_anomalies(df1, df2, method='unknown')
+
+    def test_drift_metrics(self):
+        df1 = pd.DataFrame({'A': np.arange(1000.0), 'B': ['x', 'y'] * 500})
+        col_summary, _ = dc.compare_datasets(df1, df1)
+        self.assertEqual(col_summary['PSI'].tolist(), [0.0, 0.0])
+        self.assertEqual(col_summary['JS Divergence'].tolist(), [0.0, 0.0])
+
+        df2 = pd.DataFrame({'A': np.arange(1000.0) + 500, 'B': ['x'] * 1000})
+        col_summary, _ = dc.compare_datasets(df1, df2)
+        self.assertAlmostEqual(col_summary['KS Statistic'][0], 0.5)
+        self.assertTrue(np.isnan(col_summary['KS Statistic'][1]))
+        self.assertAlmostEqual(col_summary['JS Divergence'][1], 0.25 * np.log2(2 / 3) + 0.25 + 0.5 * np.log2(4 / 3))
+        self.assertTrue((col_summary['PSI'] > 0.25).all())
+
+    @unittest.skipIf(pyspark is None, "pyspark is not installed")
+    def test_detect_anomalies_spark(self):
+        # The Spark version lives in a script whose name is not a module name
+        spec = importlib.util.spec_from_file_location('datacompare_spark', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datacompare-spark.py'))
+        dc_spark = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(dc_spark)
+        spark = SparkSession.builder.master('local[1]').appName('datacompare_tests').getOrCreate()
+        self.addCleanup(spark.stop)
+
+        df1 = spark.createDataFrame(pd.DataFrame({'A': np.arange(200, dtype='float64'), 'B': np.arange(200) % 10, 'C': ['x'] * 200}))
+        df2 = spark.createDataFrame(pd.DataFrame({'A': np.append(np.arange(199, dtype='float64'), 1e6),
+                                                  'B': np.append(np.arange(199) % 10, 1000), 'C': ['x'] * 200}))
+        anomalies = dc_spark.detect_anomalies(df1, df2, contamination=0.01, seed=0).toPandas()
+        self.assertEqual(anomalies.columns.tolist(), ['A', 'B', 'anomaly'])
+        self.assertIn(1e6, anomalies['A'].tolist())
+        self.assertTrue((anomalies['anomaly'] == -1).all())
+
+        with self.assertRaises(ValueError):
+            dc_spark.detect_anomalies(df1.limit(0), df2)
+
+    def test_detect_anomalies_by_group(self):
+        df1 = pd.DataFrame({'A': np.arange(100.0), 'B': np.arange(100.0) % 10, 'C': np.arange(100.0) % 7})
+        df2 = df1.copy()
+        df2.loc[3, 'A'] = 1000.0
+        df2.loc[5, 'C'] = -1000.0
+        anomalies, flagged = dc.detect_anomalies_by_group(df1, df2, {'AB': ['A', 'B'], 'C': ['C']},
+                                                          contamination=0.01, method='zscore', max_workers=1)
+        self.assertEqual(anomalies['AB'].index.tolist(), [3])
+        self.assertEqual(anomalies['C'].columns.tolist(), ['C', 'anomaly'])
+        self.assertEqual(flagged.tolist(), [3, 5])
+
+    def test_compare_metadata(self):
+        summary = dc.compare_metadata(self.test_file_path1, self.df2.assign(C=[None, 'x', 'y']))
+        self.assertTrue(os.path.exists(self.test_file_path1 + '.profile.json'))
+        self.assertEqual(summary['Column'].tolist(), ['A', 'B', 'C'])
+        self.assertEqual(summary['Column Presence'].tolist(), ['Exists in both', 'Exists in both', 'Added to DF1'])
+        self.assertEqual(summary['Min DF2'].tolist(), [0, 0, 'x'])
+        self.assertEqual(summary['Null Count DF2'].tolist(), [0, 0, 1])
+
+        # The metadata is still returned when the profile can't be persisted
+        with tempfile.TemporaryDirectory() as data_dir:
+            path = os.path.join(data_dir, 'data.csv')
+            self.df1.to_csv(path, index=False)
+            os.mkdir(path + '.profile.json')
+            os.mkdir(f'{path}.profile.json.{os.getpid()}.tmp')
+            pd.testing.assert_frame_equal(dc.compare_metadata(path, self.df2), dc.compare_metadata(self.df1, self.df2))
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_compare_metadata_parquet(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            path = os.path.join(data_dir, 'data2.parquet')
+            self.df2.assign(B=[4.0, None, 6.0]).to_parquet(path, row_group_size=2)
+            summary = dc.compare_metadata(self.df1, path)
+
+        self.assertEqual(summary['Dtype DF2'].tolist(), ['int64', 'float64'])
+        self.assertEqual(summary['Non-null Rows DF2'].tolist(), [3, 2])
+        self.assertEqual((summary['Min DF2'].tolist(), summary['Max DF2'].tolist()), ([0, 4.0], [2, 6.0]))
+
+    def test_compare_unordered(self):
+        df2 = pd.DataFrame({'A': [3, 1, 1, 5], 'B': [6, 4, 4, 0]})
+        only_in_df1, only_in_df2 = dc.compare_unordered(self.df1, df2)
+        self.assertEqual(only_in_df1.to_dict('list'), {'A': [2], 'B': [5], 'Count': [1]})
+        self.assertEqual(only_in_df2.to_dict('list'), {'A': [1, 5], 'B': [4, 0], 'Count': [1, 1]})
+        self.assertEqual(only_in_df2.index.tolist(), [1, 3])
+
+        only_in_df1, only_in_df2 = dc.compare_unordered(self.df1, self.df1.iloc[::-1].astype('float64'))
+        self.assertEqual((len(only_in_df1), len(only_in_df2)), (0, 0))
+
+        with self.assertRaises(ValueError):
+            dc.compare_unordered(pd.DataFrame({'Count': [1, 2, 3]}), pd.DataFrame({'Count': [1, 2, 4]}))
+
+    def test_compare_datasets_string_codes(self):
+        df1 = pd.DataFrame({'S': ['a', 'b', None, 'c', 'b']})
+        df2 = pd.DataFrame({'S': ['a', 'x', None, None, 'x']})
+        col_summary, row_diffs = dc.compare_datasets(df1, df2)
+        self.assertEqual(col_summary['Number of Differences'][0], 3)
+        self.assertEqual(col_summary['Top 5 Changes'][0], '[{"from": "b", "to": "x", "count": 2}, {"from": "c", "to": null, "count": 1}]')
+        self.assertEqual(col_summary['Top 5 values DF2'][0], {'x': 2, 'a': 1})
+        self.assertEqual(row_diffs['All_isequal'].tolist(), [True, False, True, False, False])
+
+        categories = pd.CategoricalDtype(['a', 'b', 'c', 'x'])
+        categorical_summary, _ = dc.compare_datasets(df1.astype(categories), df2.astype(categories))
+        self.assertEqual(categorical_summary['Top 5 Changes'][0], col_summary['Top 5 Changes'][0])
+        if pyarrow is not None:
+            arrow_summary, _ = dc.compare_datasets(df1.astype('string[pyarrow]'), df2.astype('string[pyarrow]'))
+            pd.testing.assert_frame_equal(arrow_summary, col_summary)
+
+    def test_compare_datasets_null_semantics(self):
+        # Null against null is equal, null against a value differs, and float NaN and pd.NA behave like object None
+        float_summary, float_row_diffs = dc.compare_datasets(pd.DataFrame({'N': [np.nan, np.nan, 1.0, 2.0]}),
+                                                             pd.DataFrame({'N': [np.nan, 1.0, np.nan, 2.0]}))
+        object_summary, object_row_diffs = dc.compare_datasets(pd.DataFrame({'N': [None, None, 'a', 'b']}),
+                                                               pd.DataFrame({'N': [None, 'a', None, 'b']}))
+        boolean_summary, boolean_row_diffs = dc.compare_datasets(pd.DataFrame({'N': pd.array([None, None, True, False], dtype='boolean')}),
+                                                                 pd.DataFrame({'N': pd.array([None, True, None, False], dtype='boolean')}))
+        for col_summary, row_diffs in ((float_summary, float_row_diffs), (object_summary, object_row_diffs),
+                                       (boolean_summary, boolean_row_diffs)):
+            self.assertEqual(col_summary['Number of Differences'][0], 2)
+            self.assertEqual(row_diffs['N_isequal'].tolist(), [True, False, False, True])
+            self.assertEqual(row_diffs['All_isequal'].tolist(), [True, False, False, True])
+        self.assertCountEqual(json.loads(float_summary['Top 5 Changes'][0]),
+                              [{'from': None, 'to': 1.0, 'count': 1}, {'from': 1.0, 'to': None, 'count': 1}])
+        self.assertCountEqual(json.loads(object_summary['Top 5 Changes'][0]),
+                              [{'from': None, 'to': 'a', 'count': 1}, {'from': 'a', 'to': None, 'count': 1}])
+        self.assertCountEqual(json.loads(boolean_summary['Top 5 Changes'][0]),
+                              [{'from': None, 'to': True, 'count': 1}, {'from': True, 'to': None, 'count': 1}])
+
+    def test_compare_datasets_optimize_dtypes(self):
+        df1 = pd.DataFrame({'S': ['x', 'x', 'x', 'y', 'z', None], 'I': [1, 2, 3, 4, 5, 6]})
+        df2 = pd.DataFrame({'S': ['x', 'x', 'x', 'y', 'v', 'w'], 'I': [1, 2, 3, 4, 5, 7]})
+        expected, expected_row_diffs = dc.compare_datasets(df1, df2)
+        col_summary, row_diffs = dc.compare_datasets(df1, df2, optimize_dtypes=True)
+        self.assertEqual(col_summary['Top 5 values DF1'][0], {'x': 3, 'y': 1, 'z': 1})
+        pd.testing.assert_frame_equal(col_summary, expected)
+        self.assertEqual(row_diffs['All_isequal'].tolist(), expected_row_diffs['All_isequal'].tolist())
+
+    def test_compare_datasets_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            col_summary, row_diffs = dc.compare_datasets(self.test_file_path1, self.test_file_path2, cache_dir=cache_dir)
+            cached_summary, cached_row_diffs = dc.compare_datasets(self.test_file_path1, self.test_file_path2, cache_dir=cache_dir)
+            pd.testing.assert_frame_equal(cached_summary, col_summary)
+            pd.testing.assert_frame_equal(cached_row_diffs, row_diffs)
+
+            # Changing an input invalidates the cached result
+            self.df1.to_csv(self.test_file_path2, index=False)
+            col_summary, _ = dc.compare_datasets(self.test_file_path1, self.test_file_path2, cache_dir=cache_dir)
+            self.assertEqual(col_summary['Number of Differences'].sum(), 0)
+
+            # A column missing from one file is filled with pd.NA, which a cache hit returns unchanged
+            self.df2.assign(C=['x', None, 'y']).to_csv(self.test_file_path2, index=False)
+            col_summary, row_diffs = dc.compare_datasets(self.test_file_path1, self.test_file_path2, cache_dir=cache_dir)
+            cached_summary, cached_row_diffs = dc.compare_datasets(self.test_file_path1, self.test_file_path2, cache_dir=cache_dir)
+            self.assertIs(cached_row_diffs['C_df1'][0], pd.NA)
+            pd.testing.assert_frame_equal(cached_summary, col_summary)
+            pd.testing.assert_frame_equal(cached_row_diffs, row_diffs)
+
+    def test_compare_datasets_lazy(self):
+        _, expected = dc.compare_datasets(self.df1, self.df2)
+        _, row_diffs = dc.compare_datasets(self.df1, self.df2, lazy=True)
+        self.assertIsInstance(row_diffs, dc.RowDiffs)
+        self.assertEqual(row_diffs.columns, expected.columns.tolist())
+        pd.testing.assert_series_equal(row_diffs['B_isequal'], expected['B_isequal'])
+        pd.testing.assert_frame_equal(row_diffs.differing_rows(['A_df1', 'A_df2']), expected.loc[[1, 2], ['A_df1', 'A_df2']])
+        pd.testing.assert_frame_equal(pd.concat(row_diffs.iter_batches(batch_size=2)), expected)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_compare_datasets_memory_limit(self):
+        df1 = pd.DataFrame({'A': np.arange(2500) % 7, 'B': np.where(np.arange(2500) % 5 == 0, None, 'x')})
+        df2 = pd.DataFrame({'A': np.arange(2500) % 6, 'B': np.where(np.arange(2500) % 3 == 0, None, 'x')})
+        expected_summary, expected_row_diffs = dc.compare_datasets(df1, df2)
+
+        col_summary, row_diffs = dc.compare_datasets(df1, df2, memory_limit=1)
+        with row_diffs:
+            self.assertIsInstance(row_diffs, dc.SpilledRowDiffs)
+            pd.testing.assert_frame_equal(col_summary, expected_summary)
+            pd.testing.assert_frame_equal(row_diffs.to_frame(), expected_row_diffs)
+            pd.testing.assert_frame_equal(row_diffs.differing_rows(), expected_row_diffs[~expected_row_diffs['All_isequal']])
+        self.assertFalse(os.path.exists(row_diffs.path))
+
+        # A column missing from one dataset reads back as the pd.NA it is filled with in memory
+        _, expected_row_diffs = dc.compare_datasets(df1.assign(C='y'), df2)
+        _, row_diffs = dc.compare_datasets(df1.assign(C='y'), df2, memory_limit=1)
+        with row_diffs:
+            self.assertIs(expected_row_diffs['C_df2'][0], pd.NA)
+            self.assertIs(row_diffs.to_frame()['C_df2'][0], pd.NA)
+
+    def test_compare_datasets_progress(self):
+        import threading
+        events = []
+        dc.compare_datasets(self.df1, self.df2, progress=events.append)
+        self.assertEqual([event['phase'] for event in events], ['load', 'compare', 'compare', 'row_diffs'])
+        self.assertEqual((events[2]['columns_done'], events[2]['rows_done'], events[2]['eta']), (2, 3, 0.0))
+
+        cancel = threading.Event()
+        with self.assertRaises(dc.ComparisonCancelled):
+            dc.compare_datasets(self.df1, self.df2, progress=lambda event: cancel.set(), cancel=cancel)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_write_row_diffs_cancelled(self):
+        def batches():
+            yield self.df1
+            raise dc.ComparisonCancelled()
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            with self.assertRaises(dc.ComparisonCancelled):
+                dc.write_row_diffs(batches(), os.path.join(output_dir, 'rows.parquet'))
+            with self.assertRaises(dc.ComparisonCancelled):
+                dc.write_row_diffs(batches(), os.path.join(output_dir, 'rows'), partition_by_column=True)
+            self.assertEqual(os.listdir(output_dir), [])
+
+    def test_compare_datasets_sample(self):
+        col_summary, row_diffs = dc.compare_datasets(self.df1, self.df2, sample=2, random_state=0)
+        self.assertEqual(len(row_diffs), 2)
+        self.assertTrue((col_summary['Percentage CI Lower'] <= col_summary['Estimated Percentage of Differences']).all())
+        self.assertTrue((col_summary['Estimated Percentage of Differences'] <= col_summary['Percentage CI Upper']).all())
+
+        # Sampling every row gives the exact result
+        col_summary, _ = dc.compare_datasets(self.df1, self.df2, sample=1.0, sample_key='A')
+        self.assertEqual(col_summary['Estimated Number of Differences'].tolist(), [1, 1])
+        self.assertEqual(col_summary['Percentage CI Lower'].tolist(), col_summary['Percentage CI Upper'].tolist())
+
+    def test_compare_partitioned(self):
+        with tempfile.TemporaryDirectory() as dir1, tempfile.TemporaryDirectory() as dir2:
+            for i in range(3):
+                self.df1.iloc[i:i+1].to_csv(os.path.join(dir1, f'part-{i}.csv'), index=False)
+                self.df2.iloc[i:i+1].to_csv(os.path.join(dir2, f'part-{i}.csv'), index=False)
+
+            col_summary = dc.compare_partitioned(dir1, dir2, max_workers=2)
+
+        expected, _ = dc.compare_datasets(self.df1, self.df2)
+        pd.testing.assert_frame_equal(col_summary.drop(columns=['Top 5 values DF1', 'Top 5 values DF2']),
+                                      expected.drop(columns=['Top 5 values DF1', 'Top 5 values DF2']), check_dtype=False)
+        self.assertEqual(col_summary['Top 5 values DF2'][1], {4: 1, 0: 1, 6: 1})
+
+    def test_partial_summary_merge_new_column(self):
+        # Outliers of a column first seen in a later partition are reported at their row in the whole dataset
+        first = dc.PartialSummary(self.df1, self.df2)
+        values = [1.0] * 9 + [100.0]
+        later = dc.PartialSummary(pd.DataFrame({'A': 1, 'B': 1, 'C': values}), pd.DataFrame({'A': 1, 'B': 1, 'C': values}))
+        col_summary = first.merge(later).to_col_summary()
+        self.assertEqual(json.loads(col_summary.set_index('Column').loc['C', 'Outliers DF1']), {'12': 100.0})
+
+    @unittest.skipIf(sqlalchemy is None, "sqlalchemy is not installed")
+    def test_compare_sql_tables(self):
+        with tempfile.TemporaryDirectory() as db_dir:
+            url = 'sqlite:///' + os.path.join(db_dir, 'data.db')
+            engine = sqlalchemy.create_engine(url)
+            self.df1.assign(C=['x', None, 'y'], id=[0, 1, 2]).to_sql('t1', engine, index=False)
+            self.df2.assign(C=['x', 'z', 'y'], id=[0, 1, 2]).to_sql('t2', engine, index=False)
+            engine.dispose()
+
+            table1 = dc.SqlTable(url, 't1', order_by='id')
+            table2 = dc.SqlTable(url, 't2', order_by='id')
+            col_summary = dc.compare_sql_tables(table1, table2, chunksize=2)
+            expected, _ = dc.compare_datasets(table1, table2)
+
+        pd.testing.assert_frame_equal(col_summary, expected, check_dtype=False)
+
+    @unittest.skipIf(sqlalchemy is None, "sqlalchemy is not installed")
+    def test_compare_sql_join(self):
+        with tempfile.TemporaryDirectory() as db_dir:
+            url1 = 'sqlite:///' + os.path.join(db_dir, 'data1.db')
+            url2 = 'sqlite:///' + os.path.join(db_dir, 'data2.db')
+            for url, df, table in ((url1, self.df1, 't1'), (url2, self.df2.iloc[::-1], 't2')):
+                engine = sqlalchemy.create_engine(url)
+                df.assign(id=df.index).to_sql(table, engine, index=False)
+                engine.dispose()
+
+            col_summary, row_diffs = dc.compare_sql_join(dc.SqlTable(url1, 't1'), dc.SqlTable(url2, 't2'), key='id')
+            # The second file is detached again, so joining the same tables twice works
+            second_summary, _ = dc.compare_sql_join(dc.SqlTable(url1, 't1'), dc.SqlTable(url2, 't2'), key='id')
+            pd.testing.assert_frame_equal(second_summary, col_summary)
+
+        expected_summary, expected_row_diffs = dc.compare_datasets(self.df1, self.df2)
+        pd.testing.assert_frame_equal(col_summary, expected_summary, check_dtype=False)
+        self.assertEqual(row_diffs.index.tolist(), [1, 2])
+        pd.testing.assert_frame_equal(row_diffs, expected_row_diffs[~expected_row_diffs['All_isequal']], check_names=False)
+
+    def test_compare_incremental(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            state_path = os.path.join(state_dir, 'state.pkl')
+            self.df1.iloc[:2].to_csv(self.test_file_path1, index=False)
+            self.df2.iloc[:1].to_csv(self.test_file_path2, index=False)
+            col_summary, row_diffs = dc.compare_incremental(self.test_file_path1, self.test_file_path2, state_path)
+            self.assertEqual(len(row_diffs), 1)
+            self.assertEqual(col_summary['Non-null Rows DF1'].tolist(), [1, 1])
+
+            # Append the remaining rows, only those are compared
+            self.df1.iloc[2:].to_csv(self.test_file_path1, index=False, header=False, mode='a')
+            self.df2.iloc[1:].to_csv(self.test_file_path2, index=False, header=False, mode='a')
+            col_summary, row_diffs = dc.compare_incremental(self.test_file_path1, self.test_file_path2, state_path)
+            self.assertEqual(row_diffs.index.tolist(), [1, 2])
+
+        expected, _ = dc.compare_datasets(self.df1, self.df2)
+        pd.testing.assert_frame_equal(col_summary, expected, check_dtype=False)
+
+    def test_compare_blocks(self):
+        self.assertEqual(dc.locate_differences(self.test_file_path1, self.test_file_path2, block_size=1), [(1, 2), (2, 3)])
+        self.assertEqual(dc.locate_differences(self.test_file_path1, self.test_file_path1, block_size=2), [])
+
+        with tempfile.TemporaryDirectory() as tree_dir:
+            col_summary, row_diffs = dc.compare_blocks(self.test_file_path1, self.test_file_path2, block_size=2, tree_cache_dir=tree_dir)
+            self.assertEqual(len(os.listdir(tree_dir)), 2)
+        self.assertEqual(col_summary['Number of Differences'].tolist(), [1, 1])
+        self.assertEqual(row_diffs.index.tolist(), [0, 1, 2])
+
+    def test_profile_store(self):
+        from datetime import datetime, timedelta
+        now = datetime(2024, 1, 31)
+        with tempfile.TemporaryDirectory() as store_dir:
+            store = dc.ProfileStore(os.path.join(store_dir, 'profiles.db'))
+            for days_ago, df2 in ((40, self.df1), (20, self.df1), (0, self.df2)):
+                col_summary, row_diffs = dc.compare_datasets(self.df1, df2)
+                store.record(col_summary, len(row_diffs), dataset='test', run_time=now - timedelta(days=days_ago))
+
+            self.assertEqual(len(store.history('test', column='A')), 3)
+            self.assertEqual(len(store.history('test', days=30, until=now)), 4)
+
+            drift = store.drifted_columns('mean_df2', 0.4, dataset='test', until=now)
+            self.assertEqual(drift['column'].tolist(), ['A'])
+            self.assertAlmostEqual(drift['change'][0], -0.5)
+
+    def test_compare_many(self):
+        summary = dc.compare_many(self.test_file_path1, {'same': self.df1, 'changed': self.test_file_path2}, max_workers=2)
+        self.assertEqual(summary['Candidate'].unique().tolist(), ['same', 'changed'])
+        self.assertEqual(summary[summary['Candidate'] == 'same']['Number of Differences'].sum(), 0)
+
+        col_summary, _ = dc.compare_datasets(self.test_file_path1, self.test_file_path2)
+        changed = summary[summary['Candidate'] == 'changed'].drop(columns='Candidate').reset_index(drop=True)
+        pd.testing.assert_frame_equal(changed, col_summary)
+
+        # The baseline's value counts and drift bins are reused from its profile, giving the same drift metrics
+        baseline = self.df1.assign(C=['x', 'y', 'x'])
+        candidate = self.df2.assign(C=['x', 'y', 'z'])
+        summary = dc.compare_many(baseline, {'changed': candidate})
+        col_summary, _ = dc.compare_datasets(baseline, candidate)
+        pd.testing.assert_frame_equal(summary.drop(columns='Candidate'), col_summary)
+
+    def test_optimize_memory(self):
+        df1 = self.df1.assign(C=['x', 'y', 'x'])
+        df2 = self.df2.assign(C=['x', 'z', 'x'])
+        opt1, opt2, report = dc.optimize_memory(df1, df2, max_category_ratio=1)
+        self.assertEqual(opt1['A'].dtype, 'int8')
+        self.assertEqual(list(opt1['C'].cat.categories), list(opt2['C'].cat.categories))
+        self.assertEqual(df1['C'].dtype, object)
+        self.assertEqual(len(report), 3)
+
+        col_summary, _ = dc.compare_datasets(df1, df2, optimize_dtypes=True)
+        self.assertEqual(col_summary['Number of Differences'].tolist(), [1, 1, 1])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_write_results(self):
+        col_summary, row_diffs = dc.compare_datasets(self.df1, self.df2)
+        with tempfile.TemporaryDirectory() as output_dir:
+            summary_path, row_diffs_path = dc.write_results(col_summary, row_diffs, output_dir, batch_size=2)
+            self.assertEqual(pd.read_parquet(summary_path)['Column'].tolist(), ['A', 'B'])
+            pd.testing.assert_frame_equal(pd.read_parquet(row_diffs_path), row_diffs)
+
+            _, partitioned_path = dc.write_results(col_summary, row_diffs, output_dir, format='arrow', partition_by_column=True)
+            with pyarrow.ipc.open_file(os.path.join(partitioned_path, 'column=B', 'part-0.arrow')) as reader:
+                column_b = reader.read_pandas()
+            self.assertEqual(column_b['isequal'].tolist(), [True, False, True])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_write_row_diffs_leading_nulls(self):
+        # The first batch only holds nulls in S, the later batches strings
+        df = pd.DataFrame({'S': [None, None, None, 'a', 'b']})
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = dc.write_row_diffs(df, os.path.join(output_dir, 'rows.parquet'), batch_size=2)
+            self.assertEqual(pd.read_parquet(path)['S'].tolist(), [None, None, None, 'a', 'b'])
+
 class DataFrameAssertTests(unittest.TestCase):
     def setUp(self):
         self.df1 = pd.DataFrame({'A': [1, 2, 3], 'B': [4, 5, 6]})
@@ -8,8 +8,7 @@ col_summary, row_diffs = dc.compare_datasets('data1.csv', 'data2.csv')
 print('Finsihed comparing datasets')
 
 # Save output data sets
-col_summary.to_csv('column_summary.csv', index=False)
-row_diffs.to_csv('row_differences.csv', index=False)
+dc.write_results(col_summary, row_diffs, 'output', format='parquet', compression='zstd')
 
 df = pd.read_csv('obesity_data.csv')
 